@@ -0,0 +1,130 @@
+"""
+Concurrency stress check for the balance service: many threads deposit, withdraw and stake
+against one account in a scratch database, then the final balance, the transaction log and the
+ledger checkpoints are checked against the operations that succeeded. Run with `python -m website.balance_stress`
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from website.balances import InsufficientFundsError, credit, debit
+from website.ledger import get_balance_at
+from website.models import Transaction, User
+from website.setup_db import db
+
+DEFAULT_THREADS = 16
+DEFAULT_OPERATIONS = 200
+INITIAL_BALANCE_MINOR = 10000
+MAX_LOCK_RETRIES = 20
+
+
+def create_scratch_app(database_path: str) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def run_operation(user_id: int, operation: str, amount_minor: int) -> bool:
+    for _ in range(MAX_LOCK_RETRIES):
+        try:
+            if operation == 'deposit':
+                credit(user_id, amount_minor, 'deposit')
+            else:
+                debit(user_id, amount_minor, operation)
+            db.session.commit()
+            return True
+        except InsufficientFundsError:
+            db.session.rollback()
+            return False
+        except OperationalError:
+            # SQLite gave up waiting for the write lock, the statement had no effect
+            db.session.rollback()
+    raise RuntimeError("database stayed locked")
+
+def worker(app: Flask, user_id: int, operations: int, seed: int, results: list, lock: threading.Lock) -> None:
+    rng = random.Random(seed)
+    applied = {'deposit': 0, 'withdraw': 0, 'stake': 0, 'rejected': 0}
+    with app.app_context():
+        for _ in range(operations):
+            operation = rng.choice(('deposit', 'withdraw', 'stake'))
+            amount_minor = rng.randint(1, 5000)
+            if run_operation(user_id, operation, amount_minor):
+                applied[operation] += amount_minor
+            else:
+                applied['rejected'] += 1
+        db.session.remove()
+    with lock:
+        results.append(applied)
+
+def run_stress(app: Flask, threads: int, operations: int) -> bool:
+    with app.app_context():
+        user = User(email=f"stress-{time.time_ns()}@example.com", balance_minor=INITIAL_BALANCE_MINOR)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    results: list = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(app, user_id, operations, seed, results, lock))
+            for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    deposited = sum(result['deposit'] for result in results)
+    debited = sum(result['withdraw'] + result['stake'] for result in results)
+    rejected = sum(result['rejected'] for result in results)
+    expected = INITIAL_BALANCE_MINOR + deposited - debited
+
+    with app.app_context():
+        balance_minor = db.session.get(User, user_id).balance_minor
+        logged = dict(db.session.query(Transaction.type, func.sum(Transaction.amount_minor))
+                      .filter(Transaction.user_id == user_id)
+                      .group_by(Transaction.type)
+                      .all())
+        ledger_balance = get_balance_at(user_id)
+        seqs = [seq for seq, in db.session.query(Transaction.seq).filter(Transaction.user_id == user_id)
+                .order_by(Transaction.seq)]
+    logged_balance = INITIAL_BALANCE_MINOR + logged.get('deposit', 0) - logged.get('withdraw', 0) - logged.get('stake', 0)
+
+    total = threads * operations
+    print(f"{total} operations from {threads} threads in {seconds:.2f}s ({total / seconds:.0f} ops/s), "
+          f"{rejected} rejected for insufficient funds")
+    print(f"Final balance {balance_minor}, expected {expected}, from transactions {logged_balance}, "
+          f"from ledger checkpoints {ledger_balance}")
+
+    gapless = seqs == list(range(1, len(seqs) + 1))
+    ok = balance_minor == expected == logged_balance == ledger_balance and balance_minor >= 0 and gapless
+    print("OK" if ok else "MISMATCH")
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--operations', type=int, default=DEFAULT_OPERATIONS, help="operations per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_scratch_app(os.path.join(directory, "stress.db"))
+        ok = run_stress(app, args.threads, args.operations)
+        with app.app_context():
+            db.engine.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
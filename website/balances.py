@@ -0,0 +1,121 @@
+"""
+Atomic balance operations. Balances are integer minor units (cents) and every change is a single
+conditional UPDATE that also allocates the next ledger seq, written together with its ledger entry
+in the caller's database transaction
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from website.models import BalanceCheckpoint, Transaction, User
+from website.setup_db import db
+
+MINOR_UNITS = 100
+LEDGER_TYPES = ('deposit', 'withdraw', 'stake', 'payout', 'lottery')
+DEBIT_TYPES = ('withdraw', 'stake')
+CHECKPOINT_INTERVAL = 100
+# largest single amount accepted from users (1,000,000.00), which keeps balances and
+# stake * odd far inside SQLite's 64-bit INTEGER
+MAX_AMOUNT_MINOR = 100_000_000
+
+
+class InsufficientFundsError(ValueError):
+    pass
+
+
+def to_minor(amount: float) -> int:
+    return int(round(amount * MINOR_UNITS))
+
+def from_minor(amount_minor: int) -> float:
+    return amount_minor / MINOR_UNITS
+
+def parse_amount(value) -> int:
+    """
+    Parses a user-entered amount into minor units, rejecting fractions of a cent and
+    amounts beyond MAX_AMOUNT_MINOR either way.
+    """
+    try:
+        amount = Decimal(str(value).strip())
+        valid = (amount.is_finite() and abs(amount) <= Decimal(MAX_AMOUNT_MINOR) / MINOR_UNITS
+                 and amount == amount.quantize(Decimal(1) / MINOR_UNITS))
+    except (ArithmeticError, TypeError):
+        raise ValueError("Invalid amount entered.")
+    if not valid:
+        raise ValueError("Invalid amount entered.")
+    return int(amount * MINOR_UNITS)
+
+def get_signed_amount(amount_minor: int, transaction_type: str) -> int:
+    return -amount_minor if transaction_type in DEBIT_TYPES else amount_minor
+
+def record_entries(entries: list[dict]) -> None:
+    """
+    Writes ledger entries given as dicts with user_id, amount_minor, type, seq and the
+    balance_minor after the entry. The first entry of a user gets an opening checkpoint,
+    and every CHECKPOINT_INTERVAL-th entry a checkpoint of the balance after it.
+    """
+    if not entries:
+        return
+    if any(entry['type'] not in LEDGER_TYPES for entry in entries):
+        raise ValueError("Unknown ledger entry type")
+
+    now = datetime.now(timezone.utc)
+    checkpoints = []
+    for entry in entries:
+        if entry['seq'] == 1:
+            checkpoints.append({'user_id': entry['user_id'], 'seq': 0, 'created_at': now,
+                                'balance_minor': entry['balance_minor'] - get_signed_amount(entry['amount_minor'], entry['type'])})
+        if entry['seq'] % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append({'user_id': entry['user_id'], 'seq': entry['seq'], 'created_at': now,
+                                'balance_minor': entry['balance_minor']})
+
+    db.session.execute(insert(Transaction.__table__),
+                       [{'user_id': entry['user_id'], 'amount_minor': entry['amount_minor'], 'type': entry['type'],
+                         'seq': entry['seq'], 'created_at': now} for entry in entries])
+    if checkpoints:
+        # users carried over from before the ledger already have their opening checkpoint
+        db.session.execute(sqlite_insert(BalanceCheckpoint.__table__).on_conflict_do_nothing(), checkpoints)
+
+def credit(user_id: int, amount_minor: int, transaction_type: str) -> int:
+    """
+    Adds to the balance and returns the new balance. Does not commit.
+    """
+    if amount_minor <= 0:
+        raise ValueError("The amount must be positive")
+
+    users = User.__table__
+    row = db.session.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(balance_minor=users.c.balance_minor + amount_minor, ledger_seq=users.c.ledger_seq + 1)
+        .returning(users.c.balance_minor, users.c.ledger_seq)
+    ).first()
+    if row is None:
+        raise ValueError("User not found")
+
+    record_entries([{'user_id': user_id, 'amount_minor': amount_minor, 'type': transaction_type,
+                     'seq': row.ledger_seq, 'balance_minor': row.balance_minor}])
+    return row.balance_minor
+
+def debit(user_id: int, amount_minor: int, transaction_type: str) -> int:
+    """
+    Subtracts from the balance only if it covers the amount and returns the new balance.
+    Raises InsufficientFundsError otherwise. Does not commit.
+    """
+    if amount_minor <= 0:
+        raise ValueError("The amount must be positive")
+
+    users = User.__table__
+    row = db.session.execute(
+        update(users)
+        .where(users.c.id == user_id, users.c.balance_minor >= amount_minor)
+        .values(balance_minor=users.c.balance_minor - amount_minor, ledger_seq=users.c.ledger_seq + 1)
+        .returning(users.c.balance_minor, users.c.ledger_seq)
+    ).first()
+    if row is None:
+        raise InsufficientFundsError("Insufficient funds.")
+
+    record_entries([{'user_id': user_id, 'amount_minor': amount_minor, 'type': transaction_type,
+                     'seq': row.ledger_seq, 'balance_minor': row.balance_minor}])
+    return row.balance_minor
@@ -0,0 +1,54 @@
+"""
+Keyset-paginated bet history and per-user bet summaries
+"""
+from typing import Optional
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from website.balances import from_minor
+from website.models import Bet, BetMatch
+from website.setup_db import db
+
+BETS_PAGE_SIZE = 20
+
+
+def get_bet_history_page(user_id: int, before_id: Optional[int] = None,
+                         page_size: int = BETS_PAGE_SIZE) -> tuple[list[Bet], Optional[int]]:
+    """
+    Returns one page of the user's placed bets, newest first, with their legs and
+    matches loaded, and the id to pass as before_id for the next page (None on the last page).
+    """
+    query = (Bet.query
+             .options(selectinload(Bet.bet_matches).joinedload(BetMatch.match))
+             .filter(Bet.user_id == user_id, Bet.status != 'PENDING'))
+
+    if before_id is not None:
+        # compare against the stored date so the cursor never depends on datetime formatting
+        cursor_date = (select(Bet.date)
+                       .where(Bet.id == before_id, Bet.user_id == user_id)
+                       .scalar_subquery())
+        query = query.filter(or_(Bet.date < cursor_date, and_(Bet.date == cursor_date, Bet.id < before_id)))
+
+    bets = query.order_by(Bet.date.desc(), Bet.id.desc()).limit(page_size + 1).all()
+
+    next_before_id = bets[page_size - 1].id if len(bets) > page_size else None
+    return bets[:page_size], next_before_id
+
+def get_bet_summary(user_id: int) -> dict:
+    row = (db.session.query(
+               func.count(Bet.id).label('bets'),
+               func.sum(case((Bet.status == 'PLACED', 1), else_=0)).label('open'),
+               func.sum(case((Bet.user_won.is_(True), 1), else_=0)).label('won'),
+               func.coalesce(func.sum(Bet.stake_minor), 0).label('staked'),
+               func.coalesce(func.sum(case((Bet.user_won.is_(True), Bet.win_minor), else_=0)), 0).label('winnings'))
+           .filter(Bet.user_id == user_id, Bet.status != 'PENDING')
+           .one())
+
+    return {
+        'bets': row.bets,
+        'open': row.open or 0,
+        'won': row.won or 0,
+        'staked': from_minor(row.staked),
+        'winnings': from_minor(row.winnings),
+    }
@@ -0,0 +1,195 @@
+"""
+Bet slips: selections live in the user's session with a TTL and are only written
+to the database, in one transaction, when the slip is staked
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import session
+
+from website.balances import debit
+from website.liability import add_bet_liability
+from website.models import Bet, BetMatch, User
+from website.odds_snapshot import MatchQuote, get_snapshot
+from website.setup_db import db
+
+DEFAULT_SLIP_TTL = int(os.getenv("BET_SLIP_TTL", "3600"))
+MAX_SLIP_LEGS = 20
+WINNERS = ('HOME_TEAM', 'DRAW', 'AWAY_TEAM')
+# largest potential win of a single bet (10,000,000,000.00), so stake * odd always fits SQLite's INTEGER
+MAX_WIN_MINOR = 10 ** 12
+
+
+class SlipLeg:
+    __slots__ = ("match_id", "winner", "odd", "version", "home_team", "away_team")
+
+    def __init__(self, match_id: int, winner: str, odd: float, version: int,
+                 home_team: Optional[str], away_team: Optional[str]):
+        self.match_id = match_id
+        self.winner = winner
+        self.odd = odd
+        self.version = version
+        self.home_team = home_team
+        self.away_team = away_team
+
+    @classmethod
+    def from_quote(cls, quote: MatchQuote, winner: str) -> "SlipLeg":
+        odd = quote.get_odd(winner)
+        if odd is None:
+            raise ValueError(f"{quote.home_team} - {quote.away_team} has no odds yet")
+        return cls(quote.match_id, winner, odd, quote.version, quote.home_team, quote.away_team)
+
+
+class BetSlip:
+    def __init__(self):
+        self.legs: "OrderedDict[int, SlipLeg]" = OrderedDict()
+        self.expires_at = 0.0
+
+    @property
+    def odd(self) -> float:
+        odd = 1.0
+        for leg in self.legs.values():
+            odd *= leg.odd
+        return odd
+
+
+class BetSlipStore:
+    """
+    Keeps each user's selections in their signed session cookie, so every web worker sees the
+    same slip without a database write per click. Only (match_id, winner, version) is stored;
+    odds and team names always come from the odds snapshot, never from the cookie.
+    """
+    session_key = 'bet_slip'
+
+    def __init__(self, ttl: float = DEFAULT_SLIP_TTL):
+        self.ttl = ttl
+
+    def get(self, user_id: int) -> Optional[BetSlip]:
+        """
+        Returns the slip priced from the current snapshot, with each leg keeping the match version
+        it was picked at. Selections on matches no longer open for betting are left out.
+        """
+        data = session.get(self.session_key)
+        if not isinstance(data, dict) or data.get('user_id') != user_id or time.time() >= data.get('expires_at', 0):
+            return None
+        snapshot = get_snapshot()
+        slip = BetSlip()
+        for fields in data.get('legs', ()):
+            try:
+                match_id, winner, version = fields
+                leg = SlipLeg.from_quote(snapshot.get_quote(int(match_id)), winner)
+                leg.version = int(version)
+            except (TypeError, ValueError):
+                continue
+            slip.legs[leg.match_id] = leg
+        slip.expires_at = data['expires_at']
+        return slip
+
+    def save(self, user_id: int, slip: BetSlip) -> None:
+        if not slip.legs:
+            self.clear(user_id)
+            return
+        slip.expires_at = time.time() + self.ttl
+        session[self.session_key] = {
+            'user_id': user_id,
+            'expires_at': slip.expires_at,
+            'legs': [[leg.match_id, leg.winner, leg.version] for leg in slip.legs.values()],
+        }
+
+    def add_leg(self, user_id: int, leg: SlipLeg) -> BetSlip:
+        """
+        Adds a selection, replacing any earlier pick for the same match.
+        """
+        slip = self.get(user_id) or BetSlip()
+        if leg.match_id not in slip.legs and len(slip.legs) >= MAX_SLIP_LEGS:
+            raise ValueError(f"A bet can have at most {MAX_SLIP_LEGS} matches")
+        slip.legs[leg.match_id] = leg
+        self.save(user_id, slip)
+        return slip
+
+    def remove_leg(self, user_id: int, match_id: int) -> None:
+        slip = self.get(user_id)
+        if slip is not None:
+            slip.legs.pop(match_id, None)
+            self.save(user_id, slip)
+
+    def clear(self, user_id: int) -> None:
+        session.pop(self.session_key, None)
+
+
+bet_slips = BetSlipStore()
+
+
+def get_win_minor(stake_minor: int, odd: float) -> int:
+    win_minor = stake_minor * odd
+    if not win_minor <= MAX_WIN_MINOR:
+        raise ValueError("The potential win of this bet is too large, lower the stake or the number of matches")
+    return round(win_minor)
+
+
+def add_selection(user_id: int, match_id: int, winner: str, version: Optional[int]) -> BetSlip:
+    """
+    Adds a selection priced from the odds snapshot. The form must show the current match
+    version, otherwise the odds it showed may be stale and the selection is rejected.
+    """
+    if winner not in WINNERS:
+        raise ValueError("Unknown outcome")
+
+    leg = SlipLeg.from_quote(get_snapshot().get_quote(match_id), winner)
+    if version != leg.version:
+        raise ValueError(f"The odds for {leg.home_team} - {leg.away_team} have changed to {leg.odd}")
+    return bet_slips.add_leg(user_id, leg)
+
+def place_bet_slip(user: User, amount_minor: int) -> Bet:
+    """
+    Stakes the user's slip: the bet, its legs and the balance debit are written in one
+    transaction. Every leg is priced from the odds snapshot. Legs on matches no longer open
+    are dropped; when a match changed since it was picked, the slip is sent back for review
+    at the current odds instead of being placed.
+    """
+    slip = bet_slips.get(user.id)
+    if slip is None or not slip.legs:
+        raise ValueError("Your bet slip is empty")
+    if amount_minor <= 0:
+        raise ValueError("The amount must be positive")
+
+    snapshot = get_snapshot()
+    legs = []
+    repriced = False
+    for match_id, leg in list(slip.legs.items()):
+        quote = snapshot.find_quote(match_id)
+        if quote is None:
+            del slip.legs[match_id]
+            continue
+        current = slip.legs[match_id] = SlipLeg.from_quote(quote, leg.winner)
+        repriced |= current.version != leg.version
+        legs.append(current)
+    bet_slips.save(user.id, slip)
+
+    if not legs:
+        raise ValueError("None of the matches on your bet slip are open for betting")
+    if repriced:
+        raise ValueError("The odds on your bet slip have changed, please review them")
+
+    odd = 1.0
+    for leg in legs:
+        odd *= leg.odd
+
+    bet = Bet(user_id=user.id, status='PLACED', odd=odd, stake_minor=amount_minor,
+              win_minor=get_win_minor(amount_minor, odd))
+    bet.bet_matches = [BetMatch(match_id=leg.match_id, winner=leg.winner, odd=leg.odd,
+                                home_team=leg.home_team, away_team=leg.away_team) for leg in legs]
+    db.session.add(bet)
+
+    try:
+        debit(user.id, amount_minor, 'stake')
+        add_bet_liability(bet)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    bet_slips.clear(user.id)
+    return bet
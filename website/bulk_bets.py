@@ -0,0 +1,147 @@
+"""
+Places a batch of complete bet slips at once: validation against the in-memory odds snapshot,
+one balance debit and bulk Bet/BetMatch inserts in a single transaction
+"""
+import time
+from typing import Optional
+
+from sqlalchemy import insert, select
+
+from website.balances import InsufficientFundsError, debit, from_minor, parse_amount
+from website.bet_slip import MAX_SLIP_LEGS, WINNERS, get_win_minor
+from website.liability import apply_liability_deltas, get_liability_deltas
+from website.models import Bet, BetMatch, User
+from website.odds_snapshot import MatchQuote, OddsSnapshot, get_snapshot
+from website.setup_db import db
+
+MAX_BULK_SLIPS = 1000
+
+
+def parse_slip(slip) -> tuple[int, list[tuple[int, str, float, Optional[int]]]]:
+    """
+    Returns (stake in minor units, [(match_id, winner, odd, version)]) or raises ValueError.
+    The match version a leg was priced from is optional.
+    """
+    if not isinstance(slip, dict):
+        raise ValueError("A slip must be an object")
+    if 'stake' not in slip:
+        raise ValueError("A slip needs a stake and legs with match_id, winner and odd")
+    try:
+        stake_minor = parse_amount(slip['stake'])
+    except ValueError:
+        raise ValueError("The stake must be an amount in whole cents")
+    try:
+        legs = [(int(leg['match_id']), str(leg['winner']), float(leg['odd']),
+                 int(leg['version']) if leg.get('version') is not None else None) for leg in slip['legs']]
+    except (KeyError, TypeError, ValueError, OverflowError, AttributeError):
+        raise ValueError("A slip needs a stake and legs with match_id, winner and odd")
+
+    if stake_minor <= 0:
+        raise ValueError("The stake must be positive")
+    if not 0 < len(legs) <= MAX_SLIP_LEGS:
+        raise ValueError(f"A slip needs between 1 and {MAX_SLIP_LEGS} legs")
+    if len({match_id for match_id, _, _, _ in legs}) != len(legs):
+        raise ValueError("A slip can only have one leg per match")
+    if any(winner not in WINNERS for _, winner, _, _ in legs):
+        raise ValueError("Unknown outcome")
+    return stake_minor, legs
+
+def price_legs(legs: list[tuple[int, str, float, Optional[int]]],
+               snapshot: OddsSnapshot) -> list[tuple[MatchQuote, str, float]]:
+    """
+    Returns (quote, winner, current odd) per leg. A leg priced from the current match version
+    is accepted as is; otherwise the odd it was priced at must still be the current one.
+    """
+    priced = []
+    for match_id, winner, odd, version in legs:
+        quote = snapshot.get_quote(match_id)
+        current = quote.get_odd(winner)
+        if current is None:
+            raise ValueError(f"Match {match_id} has no odds yet")
+        if version != quote.version and round(odd, 2) != current:
+            raise ValueError(f"The odd for match {match_id} has changed to {current}")
+        priced.append((quote, winner, current))
+    return priced
+
+def place_bulk_slips(user_id: int, slips: list) -> dict:
+    """
+    Validates and places the slips in one transaction. Slips are accepted in order while
+    the balance covers their stakes; each slip gets its own result.
+    """
+    started = time.perf_counter()
+    if not isinstance(slips, list) or not 0 < len(slips) <= MAX_BULK_SLIPS:
+        raise ValueError(f"Send between 1 and {MAX_BULK_SLIPS} slips")
+
+    results = [None] * len(slips)
+    parsed = {}
+    for index, slip in enumerate(slips):
+        try:
+            parsed[index] = parse_slip(slip)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'error': str(e)}
+
+    snapshot = get_snapshot()
+    balance_minor = db.session.execute(select(User.balance_minor).where(User.id == user_id)).scalar() or 0
+
+    accepted = []
+    priced = {}
+    new_bets = {}
+    total_minor = 0
+    for index, (stake_minor, legs) in parsed.items():
+        try:
+            priced[index] = price_legs(legs, snapshot)
+            odd = 1.0
+            for _, _, leg_odd in priced[index]:
+                odd *= leg_odd
+            new_bets[index] = {'user_id': user_id, 'status': 'PLACED', 'stake_minor': stake_minor,
+                               'odd': odd, 'win_minor': get_win_minor(stake_minor, odd)}
+            if total_minor + stake_minor > balance_minor:
+                raise InsufficientFundsError("Insufficient funds.")
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'error': str(e)}
+            continue
+        total_minor += stake_minor
+        accepted.append(index)
+
+    if accepted:
+        try:
+            # the balance may have moved since it was read, the debit re-checks it atomically
+            debit(user_id, total_minor, 'stake')
+        except InsufficientFundsError as e:
+            db.session.rollback()
+            for index in accepted:
+                results[index] = {'index': index, 'status': 'rejected', 'error': str(e)}
+            accepted = []
+
+    if accepted:
+        bet_rows = [new_bets[index] for index in accepted]
+
+        bets = Bet.__table__
+        bet_ids = db.session.execute(
+            insert(bets).returning(bets.c.id, sort_by_parameter_order=True), bet_rows
+        ).scalars().all()
+
+        leg_rows = []
+        for index, bet_id, bet_row in zip(accepted, bet_ids, bet_rows):
+            for quote, winner, odd in priced[index]:
+                leg_rows.append({'bet_id': bet_id, 'match_id': quote.match_id, 'winner': winner, 'odd': odd,
+                                 'home_team': quote.home_team, 'away_team': quote.away_team})
+            results[index] = {'index': index, 'status': 'placed', 'bet_id': bet_id,
+                              'odd': round(bet_row['odd'], 2), 'win_amount': from_minor(bet_row['win_minor'])}
+        db.session.execute(insert(BetMatch.__table__), leg_rows)
+
+        stakes = {bet_id: bet_row for bet_id, bet_row in zip(bet_ids, bet_rows)}
+        apply_liability_deltas(get_liability_deltas(
+            ((row['match_id'], row['winner'], stakes[row['bet_id']]['stake_minor'], stakes[row['bet_id']]['win_minor'])
+             for row in leg_rows), 1))
+        db.session.commit()
+
+    seconds = time.perf_counter() - started
+    return {
+        'results': results,
+        'placed': len(accepted),
+        'rejected': len(slips) - len(accepted),
+        'staked': from_minor(total_minor) if accepted else 0.0,
+        'seconds': round(seconds, 4),
+        'slips_per_second': round(len(slips) / seconds, 1) if seconds > 0 else None,
+    }
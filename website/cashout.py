@@ -0,0 +1,125 @@
+"""
+Cash-out offers for open bets, valued in one vectorized pass from the current match odds and the
+legs already decided, and re-run only for bets on matches whose version changed since the last pass
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import bindparam, or_, select, update
+
+from website.balances import from_minor
+from website.models import Bet, BetMatch, Match
+from website.odds_engine import UPCOMING_STATUSES
+from website.setup_db import db
+
+CASHOUT_MARGIN = float(os.getenv("CASHOUT_MARGIN", "0.05"))
+OUTCOMES = {'HOME_TEAM': 0, 'DRAW': 1, 'AWAY_TEAM': 2}
+
+# match id -> version the current offers were computed from, kept by the process running the job
+_priced_versions: dict[int, int] = {}
+
+
+def get_leg_probabilities(selections: np.ndarray, odds: np.ndarray, upcoming: np.ndarray,
+                          finished: np.ndarray, won: np.ndarray) -> np.ndarray:
+    """
+    Probability that each leg still wins: 1 or 0 once decided, the margin-free implied
+    probability of the selected outcome while upcoming, and NaN (suspended) otherwise.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        implied = 1.0 / odds
+        probabilities = implied[np.arange(len(selections)), selections] / implied.sum(axis=1)
+    probabilities = np.where(upcoming, probabilities, np.nan)
+    return np.where(finished, won.astype(float), probabilities)
+
+def get_cashout_values(bet_index: np.ndarray, bet_count: int, payouts: np.ndarray,
+                       probabilities: np.ndarray, margin: float = CASHOUT_MARGIN) -> np.ndarray:
+    """
+    Values every bet as its potential payout * P(all remaining legs win), less the margin, using
+    per-bet sums of log probabilities. Bets with a lost leg are worth 0, suspended ones NaN.
+    """
+    suspended = np.bincount(bet_index, weights=np.isnan(probabilities), minlength=bet_count) > 0
+    lost = np.bincount(bet_index, weights=probabilities == 0, minlength=bet_count) > 0
+    with np.errstate(divide='ignore'):
+        log_probabilities = np.where(probabilities > 0, np.log(probabilities), 0.0)
+    win_probability = np.exp(np.bincount(bet_index, weights=log_probabilities, minlength=bet_count))
+
+    values = payouts * win_probability * (1 - margin)
+    values = np.where(suspended, np.nan, values)
+    return np.where(lost, 0.0, values)
+
+def get_changed_match_ids(force: bool) -> tuple[list[int], dict[int, int]]:
+    open_match_ids = (select(BetMatch.match_id)
+                      .join(Bet, Bet.id == BetMatch.bet_id)
+                      .where(Bet.status == 'PLACED'))
+    versions = dict(db.session.query(Match.id, Match.version).filter(Match.id.in_(open_match_ids)).all())
+    changed = [match_id for match_id, version in versions.items()
+               if force or _priced_versions.get(match_id) != version]
+    return changed, versions
+
+def update_cashout_offers(force: bool = False) -> int:
+    """
+    Re-values the open bets touching changed matches, plus bets never valued,
+    and stores the offers on the bets. Returns the number of offers written.
+    """
+    started = time.perf_counter()
+    changed_match_ids, versions = get_changed_match_ids(force)
+
+    repriced_bets = select(Bet.id).where(Bet.status == 'PLACED', or_(
+        Bet.cashout_updated_at.is_(None),
+        Bet.id.in_(select(BetMatch.bet_id).where(BetMatch.match_id.in_(changed_match_ids)))))
+    legs = (db.session.query(BetMatch.bet_id, Bet.win_minor, Bet.cashout_minor, BetMatch.winner,
+                             Match.status, Match.winner, Match.home_win_odd, Match.draw_odd, Match.away_win_odd)
+            .join(Bet, Bet.id == BetMatch.bet_id)
+            .join(Match, Match.id == BetMatch.match_id)
+            .filter(BetMatch.bet_id.in_(repriced_bets))
+            .order_by(BetMatch.bet_id)
+            .all())
+
+    written = 0
+    if legs:
+        bet_ids, bet_index = np.unique(np.array([leg[0] for leg in legs], dtype=np.int64), return_inverse=True)
+        first_leg = np.searchsorted(bet_index, np.arange(len(bet_ids)))
+        payouts = np.array([legs[i][1] or 0 for i in first_leg], dtype=float)
+        current = [legs[i][2] for i in first_leg]
+
+        selections = np.array([OUTCOMES.get(leg[3], 0) for leg in legs], dtype=np.int64)
+        odds = np.array([leg[6:9] for leg in legs], dtype=float)
+        statuses = np.array([leg[4] or '' for leg in legs])
+        finished = statuses == 'FINISHED'
+        won = np.array([leg[3] == leg[5] for leg in legs])
+
+        probabilities = get_leg_probabilities(selections, odds, np.isin(statuses, UPCOMING_STATUSES), finished, won)
+        values = get_cashout_values(bet_index, len(bet_ids), payouts, probabilities)
+
+        now = datetime.now(timezone.utc)
+        rows = []
+        for bet_id, value, previous in zip(bet_ids.tolist(), values.tolist(), current):
+            offer = None if np.isnan(value) else int(round(value))
+            rows.append({'b_id': bet_id, 'b_offer': offer, 'b_now': now})
+            written += offer != previous
+
+        bets = Bet.__table__
+        db.session.execute(
+            update(bets)
+            .where(bets.c.id == bindparam('b_id'))
+            .values(cashout_minor=bindparam('b_offer'), cashout_updated_at=bindparam('b_now')),
+            rows
+        )
+        db.session.commit()
+
+    _priced_versions.clear()
+    _priced_versions.update(versions)
+
+    if legs:
+        print(f"Valued cash-out for {len(bet_ids)} bets ({written} changed) over {len(legs)} legs "
+              f"in {round(time.perf_counter() - started, 3)}s")
+    return written
+
+def get_cashout_offer(bet_id: int) -> Optional[float]:
+    bet = db.session.get(Bet, bet_id)
+    if bet is None or bet.status != 'PLACED' or bet.cashout_minor is None:
+        return None
+    return from_minor(bet.cashout_minor)
@@ -0,0 +1,34 @@
+"""
+Persistent named cursors (high-water marks and last-run times) for the background jobs
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from website.models import SyncCursor
+from website.setup_db import db
+
+COMPETITIONS_VERSION_CURSOR = "competitions:version"
+ODDS_SNAPSHOT_CURSOR = "odds:snapshot"
+
+
+def get_cursor(name: str) -> Optional[str]:
+    cursor = SyncCursor.query.get(name)
+    return cursor.value if cursor else None
+
+def set_cursor(name: str, value: str) -> None:
+    cursor = SyncCursor.query.get(name)
+    if not cursor:
+        cursor = SyncCursor(name=name)
+        db.session.add(cursor)
+    cursor.value = value
+    cursor.updated_at = datetime.now(timezone.utc)
+
+def increment_cursor(name: str) -> None:
+    set_cursor(name, str(int(get_cursor(name) or 0) + 1))
+
+def get_cursor_time(name: str) -> Optional[datetime]:
+    value = get_cursor(name)
+    return datetime.fromisoformat(value) if value else None
+
+def set_cursor_time(name: str, value: datetime) -> None:
+    set_cursor(name, value.isoformat())
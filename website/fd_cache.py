@@ -0,0 +1,125 @@
+"""
+In-memory response cache for the FD API with per-endpoint TTLs, LRU eviction,
+stale-while-revalidate refresh and coalescing of concurrent misses
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("FD_CACHE_MAX_ENTRIES", "512"))
+
+# endpoint: (ttl, stale window) in seconds
+ENDPOINT_TTLS = {
+    "standings": (300, 3600),
+    "scorers": (900, 3600),
+    "head2head": (3600, 86400),
+    "team": (3600, 86400),
+}
+DEFAULT_TTL = (300, 600)
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until", "refreshing")
+
+    def __init__(self, value: Any, ttl: float, stale: float):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+        self.refreshing = False
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.inflight: dict = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                         "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+
+    def _store(self, key: Hashable, value: Any, endpoint: str) -> None:
+        ttl, stale = ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+        with self.lock:
+            self.entries[key] = CacheEntry(value, ttl, stale)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _refresh(self, key: Hashable, endpoint: str, loader: Callable[[], Any]) -> None:
+        try:
+            self._store(key, loader(), endpoint)
+            with self.lock:
+                self.counters["refreshes"] += 1
+        except Exception:
+            with self.lock:
+                self.counters["refresh_errors"] += 1
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+
+    def get(self, endpoint: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        key = (endpoint, key)
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now < entry.stale_until:
+                self.entries.move_to_end(key)
+                if now < entry.fresh_until:
+                    self.counters["hits"] += 1
+                    return entry.value
+
+                self.counters["stale_hits"] += 1
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    threading.Thread(target=self._refresh, args=(key, endpoint, loader), daemon=True).start()
+                return entry.value
+
+            waiter = self.inflight.get(key)
+            if waiter is None:
+                waiter = self.inflight[key] = {"event": threading.Event(), "value": None, "error": None}
+                leader = True
+                self.counters["misses"] += 1
+            else:
+                leader = False
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            waiter["event"].wait()
+            if waiter["error"] is not None:
+                raise waiter["error"]
+            return waiter["value"]
+
+        try:
+            value = loader()
+            self._store(key, value, endpoint)
+            waiter["value"] = value
+            return value
+        except Exception as e:
+            waiter["error"] = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            waiter["event"].set()
+
+    def invalidate(self, endpoint: str, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop((endpoint, key), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+        return stats
+
+
+response_cache = ResponseCache()
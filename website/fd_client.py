@@ -0,0 +1,163 @@
+"""
+Shared HTTP client for the FD API with connection pooling, rate limiting, retries and timeouts
+"""
+import os
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+import dotenv
+import requests
+from requests.adapters import HTTPAdapter
+
+from website.metrics import observe_api_call
+
+dotenv.load_dotenv()
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("FD_REQUESTS_PER_MINUTE", "10"))
+MAX_RETRIES = int(os.getenv("FD_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+POOL_SIZE = 10
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# (connect timeout, read timeout) in seconds, first matching pattern wins
+ENDPOINT_TIMEOUTS = [
+    (re.compile(r"^competitions/[^/]+/matches"), (5, 30)),
+    (re.compile(r"^competitions/?$"), (5, 20)),
+    (re.compile(r"^matches/\d+/head2head"), (5, 10)),
+    (re.compile(r"^teams/\d+"), (5, 10)),
+]
+DEFAULT_TIMEOUT = (5, 15)
+
+
+def get_timeout(endpoint: str) -> tuple:
+    for pattern, timeout in ENDPOINT_TIMEOUTS:
+        if pattern.match(endpoint):
+            return timeout
+    return DEFAULT_TIMEOUT
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at the API's per-minute quota.
+    The quota headers returned by the API override the local estimate.
+    """
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE):
+        self.capacity = float(requests_per_minute)
+        self.tokens = float(requests_per_minute)
+        self.refill_rate = requests_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now < self.blocked_until:
+            self.updated_at = now
+            return
+        elapsed = now - max(self.updated_at, self.blocked_until)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated_at = now
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+    def update_from_headers(self, headers) -> None:
+        available = headers.get("X-Requests-Available-Minute")
+        reset = headers.get("X-RequestCounter-Reset")
+
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if available is not None and available.isdigit():
+                self.tokens = min(self.tokens, float(available))
+                if int(available) == 0 and reset is not None and reset.isdigit():
+                    self.blocked_until = max(self.blocked_until, now + int(reset))
+
+    def block_for(self, seconds: float) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class FootballDataClient:
+    def __init__(self, base_url: Optional[str], requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE):
+        self.base_url = base_url or ""
+        self.limiter = TokenBucket(requests_per_minute)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _retry_after(self, response: requests.Response, attempt: int) -> float:
+        for header in ("Retry-After", "X-RequestCounter-Reset"):
+            value = response.headers.get(header)
+            if value and value.isdigit():
+                return int(value) + random.uniform(0, 1)
+        return self._backoff(attempt)
+
+    def get(self, endpoint: str, headers: dict, params: Optional[dict] = None) -> dict:
+        url = self.base_url + endpoint
+        timeout = get_timeout(endpoint)
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                observe_api_call(endpoint, "error", time.perf_counter() - started)
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            observe_api_call(endpoint, response.status_code, time.perf_counter() - started)
+            self.limiter.update_from_headers(response.headers)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                delay = self._retry_after(response, attempt)
+                if response.status_code == 429:
+                    self.limiter.block_for(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            if response.status_code >= 300:
+                raise ValueError(f"Bad response - status code: {response.status_code}")
+
+            return response.json()
+
+        raise ValueError("Bad response - retries exhausted")
+
+
+_client: Optional[FootballDataClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> FootballDataClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FootballDataClient(os.getenv("URL"))
+    return _client
@@ -3,17 +3,19 @@ Implements the integration with the FD API
 """
 from datetime import datetime
 import dotenv
+import hashlib
+import json
 import os
-import requests
 
 from typing import Dict, List, Optional
 
+from .fd_cache import response_cache
+from .fd_client import get_client
+from .fixtures import parse_utc_date
 from .models import *
 
 dotenv.load_dotenv()
 
-football_base_url = os.getenv('URL')
-
 def get_api_key() -> Optional[str]:
     api_key = os.getenv("FOOTBALL_DATA_API_KEY")
 
@@ -30,14 +32,8 @@ def get_football_data_request_headers() -> dict:
 
     return headers
 
-def fetch_football_data(endpoint: str) -> dict:
-    url = football_base_url + endpoint
-    
-    response = requests.get(url, headers=get_football_data_request_headers())
-    if response.status_code >= 300:
-        raise ValueError(f"Bad response - status code: {response.status_code}")
-    
-    return response.json()
+def fetch_football_data(endpoint: str, params: Optional[dict] = None) -> dict:
+    return get_client().get(endpoint, headers=get_football_data_request_headers(), params=params)
 
 def update_or_create_team(
     team: Team, 
@@ -132,11 +128,49 @@ def update_match_details(
 
 
 
+def get_team_row(team_data: dict) -> dict:
+    return {
+        'id': team_data['id'],
+        'name': team_data.get('name'),
+        'short_name': team_data.get('shortName'),
+        'tla': team_data.get('tla'),
+        'crest': team_data.get('crest'),
+    }
+
+def get_match_row(match_data: dict, competition_id: int) -> dict:
+    score = match_data['score']
+    kickoff_at = parse_utc_date(match_data['utcDate'])
+    team_ids = [team_id for team_id in (match_data['homeTeam'].get('id'), match_data['awayTeam'].get('id'))
+                if team_id is not None]
+    return {
+        'id': match_data['id'],
+        'utc_date': match_data['utcDate'],
+        'kickoff_at': kickoff_at,
+        'kickoff_date': kickoff_at.date(),
+        'status': match_data['status'],
+        'stage': match_data.get('stage'),
+        'group': match_data.get('group'),
+        'winner': score.get('winner'),
+        'duration': score.get('duration'),
+        'full_time_home': score['fullTime']['home'],
+        'full_time_away': score['fullTime']['away'],
+        'half_time_home': score['halfTime']['home'],
+        'half_time_away': score['halfTime']['away'],
+        'competition_id': competition_id,
+        'home_team_id': match_data['homeTeam'].get('id'),
+        'away_team_id': match_data['awayTeam'].get('id'),
+        'team_pair_low': min(team_ids) if len(team_ids) == 2 else None,
+        'team_pair_high': max(team_ids) if len(team_ids) == 2 else None,
+        'last_updated': match_data.get('lastUpdated'),
+        'payload_hash': get_match_payload_hash(match_data),
+    }
+
+
 def get_match_head2head_by_id(match_id: int) -> Match:
     match = f'{match_id}'
     endpoint =  f"matches/{match}/head2head?limit=10"
 
-    data = fetch_football_data(endpoint)
+    data = response_cache.get("head2head", match_id, lambda: fetch_football_data(endpoint))
     return data
 
 def get_all_areas_and_competitions():
@@ -144,22 +178,43 @@ def get_all_areas_and_competitions():
     data = fetch_football_data(endpoint)
     return data
 
-def get_matches_by_competition(competiton_code: str) -> list:
+def get_matches_by_competition(
+    competiton_code: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list:
     endpoint = f"competitions/{competiton_code}/matches"
-    data = fetch_football_data(endpoint)
+    params = None
+    if date_from and date_to:
+        params = {"dateFrom": date_from, "dateTo": date_to}
+    data = fetch_football_data(endpoint, params)
     return data["matches"]
 
+def get_matches_by_ids(match_ids: list[int], chunk_size: int = 50) -> list:
+    matches = []
+    for i in range(0, len(match_ids), chunk_size):
+        ids = ",".join(map(str, match_ids[i:i + chunk_size]))
+        data = fetch_football_data("matches", {"ids": ids})
+        matches.extend(data["matches"])
+    return matches
+
+def get_match_payload_hash(match_data: dict) -> str:
+    return hashlib.sha1(json.dumps(match_data, sort_keys=True).encode()).hexdigest()
+
 def get_standings_by_competition(competiton_code: str) -> list:
     endpoint = f"competitions/{competiton_code}/standings"
-    data = fetch_football_data(endpoint)
+    data = response_cache.get("standings", competiton_code, lambda: fetch_football_data(endpoint))
     return data["standings"]
 
 def get_topscorers_by_competition(competiton_code: str) -> list:
     endpoint = f"competitions/{competiton_code}/scorers"
-    data = fetch_football_data(endpoint)
+    data = response_cache.get("scorers", competiton_code, lambda: fetch_football_data(endpoint))
     return data["scorers"]
 
 def get_team_by_id(team_id: int) -> dict:
     enpoint = f"teams/{team_id}"
-    data = fetch_football_data(enpoint)
-    return data
\ No newline at end of file
+    data = response_cache.get("team", team_id, lambda: fetch_football_data(enpoint))
+    return data
+
+def get_cache_stats() -> dict:
+    return response_cache.stats()
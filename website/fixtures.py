@@ -0,0 +1,39 @@
+"""
+Date-indexed fixture queries for the home and competition pages
+"""
+from datetime import date, datetime, timezone
+from itertools import groupby
+from typing import Optional
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from website.models import Competition, Match
+
+
+def parse_utc_date(utc_date: str) -> datetime:
+    return datetime.fromisoformat(utc_date.replace('Z', '+00:00')).astimezone(timezone.utc).replace(tzinfo=None)
+
+def parse_day(value: Optional[str]) -> date:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.utcnow().date()
+
+def get_fixtures_for_day(day: date, competition_id: Optional[int] = None) -> list[Match]:
+    query = (Match.query
+             .options(selectinload(Match.teams), joinedload(Match.competition))
+             .filter(Match.kickoff_date == day))
+    if competition_id is not None:
+        query = query.filter(Match.competition_id == competition_id)
+
+    return query.order_by(Match.competition_id, Match.kickoff_at, Match.id).all()
+
+def group_fixtures_by_competition(matches: list[Match]) -> list[tuple[Competition, list[Match]]]:
+    return [(competition, list(competition_matches))
+            for competition, competition_matches in groupby(matches, key=lambda match: match.competition)]
+
+def get_competitions_with_areas() -> list[Competition]:
+    return (Competition.query
+            .options(joinedload(Competition.area))
+            .order_by(Competition.area_id, Competition.id)
+            .all())
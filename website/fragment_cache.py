@@ -0,0 +1,48 @@
+"""
+LRU cache for rendered HTML fragments, keyed by the version stamps of the rows they show
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from markupsafe import Markup
+
+DEFAULT_MAX_FRAGMENTS = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "5000"))
+
+
+class FragmentCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_FRAGMENTS):
+        self.max_entries = max_entries
+        self.fragments: "OrderedDict[Hashable, Markup]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> Markup:
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = Markup(render())
+        with self.lock:
+            self.fragments[key] = fragment
+            self.fragments.move_to_end(key)
+            while len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+        return fragment
+
+    def clear(self) -> None:
+        with self.lock:
+            self.fragments.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.fragments)}
+
+
+fragment_cache = FragmentCache()
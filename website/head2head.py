@@ -0,0 +1,91 @@
+"""
+Head-to-head history between the two teams of a match, computed from stored matches
+"""
+from website.fd_interface import get_match_head2head_by_id
+from website.models import Match, Team
+
+H2H_LIMIT = 10
+
+
+def get_team_summary(team: Team) -> dict:
+    return {'id': team.id, 'name': team.name, 'shortName': team.short_name, 'tla': team.tla, 'crest': team.crest}
+
+def get_meeting(meeting: Match, teams: dict) -> dict:
+    return {
+        'id': meeting.id,
+        'utcDate': meeting.utc_date,
+        'status': meeting.status,
+        'homeTeam': teams[meeting.home_team_id],
+        'awayTeam': teams[meeting.away_team_id],
+        'score': {
+            'winner': meeting.winner,
+            'fullTime': {'home': meeting.full_time_home, 'away': meeting.full_time_away},
+        },
+    }
+
+def get_aggregates(meetings: list[Match], home: dict, away: dict) -> dict:
+    """
+    Wins, draws and losses are counted for the teams of the current match,
+    whichever side they played on in each meeting.
+    """
+    records = {home['id']: {'wins': 0, 'draws': 0, 'losses': 0},
+               away['id']: {'wins': 0, 'draws': 0, 'losses': 0}}
+    total_goals = 0
+
+    for meeting in meetings:
+        total_goals += (meeting.full_time_home or 0) + (meeting.full_time_away or 0)
+        if meeting.winner == 'DRAW':
+            for record in records.values():
+                record['draws'] += 1
+            continue
+
+        if meeting.winner == 'HOME_TEAM':
+            winner_id, loser_id = meeting.home_team_id, meeting.away_team_id
+        elif meeting.winner == 'AWAY_TEAM':
+            winner_id, loser_id = meeting.away_team_id, meeting.home_team_id
+        else:
+            continue
+        records[winner_id]['wins'] += 1
+        records[loser_id]['losses'] += 1
+
+    return {
+        'numberOfMatches': len(meetings),
+        'totalGoals': total_goals,
+        'homeTeam': {'id': home['id'], 'name': home['name'], **records[home['id']]},
+        'awayTeam': {'id': away['id'], 'name': away['name'], **records[away['id']]},
+    }
+
+def get_local_head2head(match: Match, limit: int = H2H_LIMIT):
+    if match.team_pair_low is None or match.team_pair_high is None:
+        return None
+
+    meetings = (Match.query
+                .filter(Match.team_pair_low == match.team_pair_low,
+                        Match.team_pair_high == match.team_pair_high,
+                        Match.status == 'FINISHED',
+                        Match.id != match.id)
+                .order_by(Match.kickoff_at.desc())
+                .limit(limit)
+                .all())
+    if not meetings:
+        return None
+
+    teams = {team.id: get_team_summary(team)
+             for team in Team.query.filter(Team.id.in_([match.team_pair_low, match.team_pair_high]))}
+    if len(teams) < 2:
+        return None
+
+    return {
+        'aggregates': get_aggregates(meetings, teams[match.home_team_id], teams[match.away_team_id]),
+        'matches': [get_meeting(meeting, teams) for meeting in meetings],
+    }
+
+def get_head2head(match: Match, limit: int = H2H_LIMIT) -> dict:
+    """
+    Returns the last meetings and their aggregates in the shape of the FD head2head endpoint.
+    The API is only called for pairings without any stored history.
+    """
+    data = get_local_head2head(match, limit)
+    if data is None:
+        data = get_match_head2head_by_id(match.id)
+    return data
@@ -0,0 +1,83 @@
+"""
+Reads over the append-only balance ledger: point-in-time balances from the nearest checkpoint plus
+a bounded tail of entries, and statements streamed as CSV or NDJSON from a server-side cursor
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import case, func, select
+
+from website.balances import CHECKPOINT_INTERVAL, DEBIT_TYPES, from_minor, get_signed_amount
+from website.models import BalanceCheckpoint, Transaction
+from website.setup_db import db
+
+STATEMENT_BATCH_SIZE = 500
+STATEMENT_COLUMNS = ('seq', 'created_at', 'type', 'amount', 'balance')
+
+signed_amount = case((Transaction.type.in_(DEBIT_TYPES), -Transaction.amount_minor), else_=Transaction.amount_minor)
+
+
+def get_balance_at(user_id: int, at: Optional[datetime] = None) -> int:
+    """
+    Returns the balance in minor units at the given time, or the current one from the ledger.
+    Reads the latest checkpoint before that time and at most CHECKPOINT_INTERVAL entries after
+    it. Before the user's first ledger entry the balance is 0.
+    """
+    checkpoints = select(BalanceCheckpoint.seq, BalanceCheckpoint.balance_minor).where(BalanceCheckpoint.user_id == user_id)
+    if at is not None:
+        checkpoints = checkpoints.where(BalanceCheckpoint.created_at <= at)
+    checkpoint = db.session.execute(checkpoints.order_by(BalanceCheckpoint.seq.desc()).limit(1)).first()
+    if checkpoint is None:
+        return 0
+
+    tail = select(func.coalesce(func.sum(signed_amount), 0)).where(Transaction.user_id == user_id,
+                                                                   Transaction.seq > checkpoint.seq)
+    if at is not None:
+        # the next checkpoint is at most CHECKPOINT_INTERVAL entries away and newer than `at`
+        tail = tail.where(Transaction.seq <= checkpoint.seq + CHECKPOINT_INTERVAL, Transaction.created_at <= at)
+    return checkpoint.balance_minor + db.session.execute(tail).scalar()
+
+def iter_statement(user_id: int) -> Iterator[dict]:
+    """
+    Yields the user's ledger entries in seq order with the running balance after each,
+    fetching STATEMENT_BATCH_SIZE rows at a time.
+    """
+    opening = db.session.execute(
+        select(BalanceCheckpoint.balance_minor).where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.seq == 0)
+    ).scalar() or 0
+
+    entries = db.session.execute(
+        select(Transaction.seq, Transaction.created_at, Transaction.type, Transaction.amount_minor)
+        .where(Transaction.user_id == user_id, Transaction.seq > 0)
+        .order_by(Transaction.seq)
+        .execution_options(yield_per=STATEMENT_BATCH_SIZE)
+    )
+    balance_minor = opening
+    for entry in entries:
+        amount_minor = get_signed_amount(entry.amount_minor, entry.type)
+        balance_minor += amount_minor
+        yield {
+            'seq': entry.seq,
+            'created_at': entry.created_at.isoformat() if entry.created_at else None,
+            'type': entry.type,
+            'amount': from_minor(amount_minor),
+            'balance': from_minor(balance_minor),
+        }
+
+def stream_statement_csv(user_id: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=STATEMENT_COLUMNS)
+    writer.writeheader()
+    for row in iter_statement(user_id):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_statement_ndjson(user_id: int) -> Iterator[str]:
+    for row in iter_statement(user_id):
+        yield json.dumps(row) + "\n"
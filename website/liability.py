@@ -0,0 +1,105 @@
+"""
+Running stake and potential payout totals per match outcome for the open bets, kept up to date
+as bets are placed and settled, with a full rebuild and a top-exposure query for risk monitoring
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
+
+from website.balances import from_minor
+from website.models import Bet, BetMatch, Match, MatchLiability
+from website.setup_db import db
+
+DEFAULT_TOP_EXPOSURES = 20
+
+
+def get_liability_deltas(legs: Iterable[tuple[int, str, int, int]], sign: int) -> list[dict]:
+    """
+    Sums (match_id, outcome, stake_minor, payout_minor) legs into one delta row per match outcome.
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for match_id, outcome, stake_minor, payout_minor in legs:
+        total = totals[(match_id, outcome)]
+        total[0] += sign
+        total[1] += sign * (stake_minor or 0)
+        total[2] += sign * (payout_minor or 0)
+
+    return [{'match_id': match_id, 'outcome': outcome, 'open_bets': open_bets,
+             'stake_minor': stake_minor, 'payout_minor': payout_minor}
+            for (match_id, outcome), (open_bets, stake_minor, payout_minor) in totals.items()]
+
+def apply_liability_deltas(rows: list[dict]) -> None:
+    if not rows:
+        return
+    liabilities = MatchLiability.__table__
+    stmt = sqlite_insert(liabilities)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[liabilities.c.match_id, liabilities.c.outcome],
+        set_={
+            'open_bets': liabilities.c.open_bets + stmt.excluded.open_bets,
+            'stake_minor': liabilities.c.stake_minor + stmt.excluded.stake_minor,
+            'payout_minor': liabilities.c.payout_minor + stmt.excluded.payout_minor,
+        })
+    db.session.execute(stmt, rows)
+
+def add_bet_liability(bet: Bet) -> None:
+    """
+    Adds a newly placed bet to the totals of each of its legs. Does not commit.
+    """
+    apply_liability_deltas(get_liability_deltas(
+        ((leg.match_id, leg.winner, bet.stake_minor, bet.win_minor) for leg in bet.bet_matches), 1))
+
+def release_bet_liability(bet_ids: list[int]) -> None:
+    """
+    Removes settled or cancelled bets from the totals of their legs. Does not commit.
+    """
+    if not bet_ids:
+        return
+    legs = (db.session.query(BetMatch.match_id, BetMatch.winner, Bet.stake_minor, Bet.win_minor)
+            .join(Bet, Bet.id == BetMatch.bet_id)
+            .filter(BetMatch.bet_id.in_(bet_ids))
+            .all())
+    apply_liability_deltas(get_liability_deltas(legs, -1))
+
+def rebuild_liability() -> int:
+    """
+    Recomputes every total from the placed bets.
+    """
+    db.session.execute(delete(MatchLiability.__table__))
+    totals = (select(BetMatch.match_id,
+                     BetMatch.winner,
+                     func.count(BetMatch.id),
+                     func.sum(Bet.stake_minor),
+                     func.sum(Bet.win_minor))
+              .join(Bet, Bet.id == BetMatch.bet_id)
+              .where(Bet.status == 'PLACED', BetMatch.winner.isnot(None))
+              .group_by(BetMatch.match_id, BetMatch.winner))
+    result = db.session.execute(
+        insert(MatchLiability.__table__)
+        .from_select(['match_id', 'outcome', 'open_bets', 'stake_minor', 'payout_minor'], totals))
+    db.session.commit()
+    return result.rowcount
+
+def get_top_exposures(limit: int = DEFAULT_TOP_EXPOSURES) -> list[dict]:
+    rows = (MatchLiability.query
+            .options(joinedload(MatchLiability.match).joinedload(Match.home_team),
+                     joinedload(MatchLiability.match).joinedload(Match.away_team))
+            .filter(MatchLiability.open_bets > 0)
+            .order_by(MatchLiability.payout_minor.desc())
+            .limit(limit)
+            .all())
+
+    return [{
+        'match_id': row.match_id,
+        'outcome': row.outcome,
+        'home_team': row.match.home_team.short_name if row.match and row.match.home_team else None,
+        'away_team': row.match.away_team.short_name if row.match and row.match.away_team else None,
+        'utc_date': row.match.utc_date if row.match else None,
+        'status': row.match.status if row.match else None,
+        'open_bets': row.open_bets,
+        'stake': from_minor(row.stake_minor),
+        'potential_payout': from_minor(row.payout_minor),
+    } for row in rows]
@@ -0,0 +1,26 @@
+"""
+Canonical bitmask form of lottery tickets: number n (1-35) is bit n - 1
+"""
+from typing import Iterable
+
+LOWEST_NUMBER = 1
+HIGHEST_NUMBER = 35
+NUMBERS_PER_TICKET = 5
+
+# prize paid per ticket by number of hits
+LOTTERY_PRIZES = {5: 30000, 4: 500, 3: 20}
+MIN_WINNING_HITS = min(LOTTERY_PRIZES)
+
+
+def numbers_to_mask(numbers: Iterable[int]) -> int:
+    numbers = set(numbers)
+    if len(numbers) != NUMBERS_PER_TICKET or not all(LOWEST_NUMBER <= n <= HIGHEST_NUMBER for n in numbers):
+        raise ValueError(f"Pick {NUMBERS_PER_TICKET} different numbers from {LOWEST_NUMBER} to {HIGHEST_NUMBER}")
+
+    mask = 0
+    for number in numbers:
+        mask |= 1 << (number - LOWEST_NUMBER)
+    return mask
+
+def mask_to_numbers(mask: int) -> list[int]:
+    return [bit + LOWEST_NUMBER for bit in range(HIGHEST_NUMBER) if mask >> bit & 1]
@@ -0,0 +1,152 @@
+"""
+Monte Carlo estimate of what a lottery draw will pay out against the current ticket book.
+Run with `python -m website.lottery_sim [--draws N] [--seed S]`.
+"""
+import argparse
+import itertools
+import math
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func
+
+from website.lottery import HIGHEST_NUMBER, LOTTERY_PRIZES, NUMBERS_PER_TICKET
+from website.models import UserNumbers
+from website.setup_db import db
+
+DEFAULT_DRAWS = 1_000_000
+CHUNK_DRAWS = 100_000
+LOTTERY_BUDGET = float(os.getenv("LOTTERY_BUDGET", "100000"))
+PERCENTILES = (50, 90, 99, 99.9)
+
+_binomials = np.array([[math.comb(n, k) for k in range(NUMBERS_PER_TICKET + 1)]
+                       for n in range(HIGHEST_NUMBER)], dtype=np.int64)
+_subset_positions = {size: np.array(list(itertools.combinations(range(NUMBERS_PER_TICKET), size)))
+                     for size in LOTTERY_PRIZES}
+
+
+def load_ticket_book() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the distinct masks of the tickets waiting for the next draw and how many tickets hold each one.
+    """
+    rows = (db.session.query(UserNumbers.mask, func.count(UserNumbers.id))
+            .filter(UserNumbers.draw_id.is_(None), UserNumbers.mask != 0)
+            .group_by(UserNumbers.mask)
+            .all())
+    masks = np.array([row[0] for row in rows], dtype=np.int64)
+    counts = np.array([row[1] for row in rows], dtype=np.float64)
+    return masks, counts
+
+def masks_to_sorted_numbers(masks: np.ndarray) -> np.ndarray:
+    """
+    Returns an (n, 5) array of the zero-based numbers in each mask, ascending.
+    """
+    bits = (masks[:, None] >> np.arange(HIGHEST_NUMBER)) & 1
+    return np.nonzero(bits)[1].reshape(-1, NUMBERS_PER_TICKET)
+
+def get_subset_ranks(numbers: np.ndarray, size: int) -> np.ndarray:
+    """
+    Returns the combinatorial-number-system rank of every size-element subset of
+    each row of ascending numbers, as an (n, C(5, size)) array.
+    """
+    subsets = numbers[:, _subset_positions[size]]
+    return sum(_binomials[subsets[..., i], i + 1] for i in range(size))
+
+def get_subset_counts(numbers: np.ndarray, counts: np.ndarray) -> dict[int, np.ndarray]:
+    """
+    For every subset size that earns a prize, counts the tickets containing each subset.
+    """
+    return {size: np.bincount(get_subset_ranks(numbers, size).ravel(),
+                              weights=np.repeat(counts, len(_subset_positions[size])),
+                              minlength=math.comb(HIGHEST_NUMBER, size))
+            for size in _subset_positions}
+
+def random_draws(rng: np.random.Generator, size: int) -> np.ndarray:
+    picks = np.argpartition(rng.random((size, HIGHEST_NUMBER)), NUMBERS_PER_TICKET, axis=1)
+    return np.sort(picks[:, :NUMBERS_PER_TICKET], axis=1)
+
+def get_tier_winners(draws: np.ndarray, subset_counts: dict[int, np.ndarray]) -> dict[int, np.ndarray]:
+    """
+    Summing the subset counts over a draw's j-subsets gives sum(C(hits, j)) over all
+    tickets; peeling off the higher tiers leaves the number of tickets per hit count.
+    """
+    subset_sums = {size: subset_counts[size][get_subset_ranks(draws, size)].sum(axis=1)
+                   for size in subset_counts}
+    winners = {}
+    for tier in sorted(subset_sums, reverse=True):
+        winners[tier] = subset_sums[tier] - sum(math.comb(higher, tier) * winners[higher] for higher in winners)
+    return winners
+
+def simulate_draws(masks: np.ndarray, counts: np.ndarray, draws: int = DEFAULT_DRAWS,
+                   seed: Optional[int] = None) -> dict:
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    tiers = sorted(LOTTERY_PRIZES, reverse=True)
+
+    subset_counts = get_subset_counts(masks_to_sorted_numbers(masks), counts)
+    payouts = np.zeros(draws)
+    winners = np.zeros((draws, len(tiers)))
+
+    for start in range(0, draws, CHUNK_DRAWS):
+        end = min(draws, start + CHUNK_DRAWS)
+        tier_winners = get_tier_winners(random_draws(rng, end - start), subset_counts)
+        for i, tier in enumerate(tiers):
+            winners[start:end, i] = tier_winners[tier]
+            payouts[start:end] += tier_winners[tier] * LOTTERY_PRIZES[tier]
+
+    return {
+        'draws': draws,
+        'tickets': int(counts.sum()),
+        'distinct_tickets': len(masks),
+        'expected_payout': float(payouts.mean()),
+        'percentiles': {p: float(np.percentile(payouts, p)) for p in PERCENTILES},
+        'max_payout': float(payouts.max()),
+        'expected_winners': {tier: float(winners[:, i].mean()) for i, tier in enumerate(tiers)},
+        'jackpot_probability': float((winners[:, 0] > 0).mean()),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def simulate_lottery(draws: int = DEFAULT_DRAWS, seed: Optional[int] = None) -> dict:
+    masks, counts = load_ticket_book()
+    return simulate_draws(masks, counts, draws, seed)
+
+def get_prize_scale(report: dict, budget: float = LOTTERY_BUDGET) -> float:
+    """
+    Scales the prize table down so the 99th percentile payout stays within the budget.
+    """
+    tail_payout = report['percentiles'][99]
+    if tail_payout <= budget:
+        return 1.0
+    return budget / tail_payout
+
+def print_report(report: dict) -> None:
+    print(f"{report['draws']} draws against {report['tickets']} tickets "
+          f"({report['distinct_tickets']} distinct) in {report['seconds']}s")
+    print(f"Expected payout: {report['expected_payout']:.2f}")
+    for percentile, value in report['percentiles'].items():
+        print(f"  p{percentile}: {value:.2f}")
+    print(f"  max: {report['max_payout']:.2f}")
+    for tier, value in report['expected_winners'].items():
+        print(f"Expected {tier}-hit winners: {value:.4f}")
+    print(f"Jackpot probability: {report['jackpot_probability']:.6f}")
+
+
+def main() -> None:
+    from website.setup_app import create_app
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--draws', type=int, default=DEFAULT_DRAWS)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app(start_scheduler=False)
+    with app.app_context():
+        report = simulate_lottery(args.draws, args.seed)
+    print_report(report)
+    print(f"Prize scale for a budget of {LOTTERY_BUDGET:.0f}: {get_prize_scale(report):.4f}")
+
+
+if __name__ == '__main__':
+    main()
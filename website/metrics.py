@@ -0,0 +1,190 @@
+"""
+In-process counters and timing histograms exposed in the Prometheus text format on /metrics
+"""
+import bisect
+import hmac
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import Blueprint, Flask, Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from website.fd_cache import response_cache
+from website.fragment_cache import fragment_cache
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# scrapers from other hosts send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values: dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                # per-bucket counts, then the +Inf count and the sum
+                series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series_items = sorted((label_values, list(series)) for label_values, series in self.values.items())
+
+        for label_values, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = format_labels(self.labels + ("le",), label_values + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+http_request_seconds = Histogram("http_request_duration_seconds", "Latency of HTTP requests",
+                                 ("endpoint", "method", "status"))
+job_seconds = Histogram("job_duration_seconds", "Duration of scheduler jobs", ("job",), JOB_BUCKETS)
+job_runs = Counter("job_runs_total", "Scheduler job runs", ("job", "result"))
+api_request_seconds = Histogram("fd_api_request_duration_seconds", "Latency of FD API calls", ("endpoint",))
+api_requests = Counter("fd_api_requests_total", "FD API calls", ("endpoint", "status"))
+db_queries = Counter("db_queries_total", "SQL statements executed", ("context",))
+
+METRICS = [http_request_seconds, job_seconds, job_runs, api_request_seconds, api_requests, db_queries]
+
+
+def get_endpoint_label(endpoint: str) -> str:
+    path = endpoint.split("?", 1)[0].strip("/")
+    path = re.sub(r"^competitions/[^/]+", "competitions/:code", path)
+    return re.sub(r"/\d+", "/:id", path)
+
+def observe_api_call(endpoint: str, status, seconds: float) -> None:
+    label = get_endpoint_label(endpoint)
+    api_requests.inc(label, str(status))
+    api_request_seconds.observe(seconds, label)
+
+@contextmanager
+def time_job(job_id: str):
+    started = time.perf_counter()
+    result = "error"
+    try:
+        yield
+        result = "ok"
+    finally:
+        job_seconds.observe(time.perf_counter() - started, job_id)
+        job_runs.inc(job_id, result)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    if has_request_context():
+        db_queries.inc(request.endpoint or "unmatched")
+    else:
+        db_queries.inc("background")
+
+def render_cache_metrics() -> list[str]:
+    stats = response_cache.stats()
+    lines = ["# HELP fd_cache_entries Entries in the FD response cache", "# TYPE fd_cache_entries gauge",
+             f"fd_cache_entries {stats.pop('entries')}",
+             "# HELP fd_cache_events_total FD response cache events", "# TYPE fd_cache_events_total counter"]
+    lines.extend(f'fd_cache_events_total{{event="{name}"}} {value}' for name, value in sorted(stats.items()))
+
+    fragments = fragment_cache.stats()
+    lines.extend(["# HELP fragment_cache_entries Rendered fragments in the cache", "# TYPE fragment_cache_entries gauge",
+                  f"fragment_cache_entries {fragments['entries']}",
+                  "# HELP fragment_cache_events_total Fragment cache lookups", "# TYPE fragment_cache_events_total counter",
+                  f'fragment_cache_events_total{{event="hits"}} {fragments["hits"]}',
+                  f'fragment_cache_events_total{{event="misses"}} {fragments["misses"]}'])
+    return lines
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(render_cache_metrics())
+    return "\n".join(lines) + "\n"
+
+
+metrics = Blueprint('metrics', __name__)
+
+def is_metrics_request_allowed() -> bool:
+    """
+    Allows direct requests from the local host, not ones forwarded by a proxy on it,
+    and requests carrying the configured token.
+    """
+    if request.remote_addr in LOCAL_ADDRESSES and 'X-Forwarded-For' not in request.headers:
+        return True
+    authorization = request.headers.get('Authorization', '')
+    return bool(METRICS_TOKEN) and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+
+@metrics.route('/metrics')
+def metrics_endpoint():
+    if not is_metrics_request_allowed():
+        abort(403)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app: Flask) -> None:
+    if not event.contains(Engine, "before_cursor_execute", _count_query):
+        event.listen(Engine, "before_cursor_execute", _count_query)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started: Optional[float] = g.pop('request_started', None)
+        if started is not None and request.endpoint != 'metrics.metrics_endpoint':
+            http_request_seconds.observe(time.perf_counter() - started,
+                                         request.endpoint or "unmatched", request.method, response.status_code)
+        return response
+
+    app.register_blueprint(metrics)
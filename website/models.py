@@ -3,6 +3,7 @@ Create SQLAlchemy database models
 """
 from flask_login import UserMixin
 from sqlalchemy import func
+from .lottery import numbers_to_mask
 from .setup_db import db
 
 match_team = db.Table('match_team',
@@ -15,42 +16,91 @@ competition_team = db.Table('competition_team',
     db.Column('team_id', db.Integer, db.ForeignKey('team.id'), primary_key=True)
 )
 
+# a player can be in a club squad and a national team squad at the same time
+team_player = db.Table('team_player',
+    db.Column('team_id', db.Integer, db.ForeignKey('team.id'), primary_key=True),
+    db.Column('player_id', db.Integer, db.ForeignKey('player.id'), primary_key=True, index=True)
+)
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(128), unique=True)
     password = db.Column(db.String(128))
-    balance = db.Column(db.Float, default=0.0)
+    # in cents, only changed through website.balances
+    balance_minor = db.Column(db.BigInteger, default=0, nullable=False)
+    # seq of the user's latest ledger entry, bumped together with the balance
+    ledger_seq = db.Column(db.BigInteger, default=0, nullable=False)
 
     bets = db.relationship('Bet', backref='user')
     transactions = db.relationship('Transaction', backref='user')
     user_numbers = db.relationship('UserNumbers', backref='user', cascade='all, delete-orphan') 
 
+    @property
+    def balance(self) -> float:
+        return (self.balance_minor or 0) / 100
+
 class Transaction(db.Model):
+    """
+    Append-only ledger entry. amount_minor is always positive, the type gives the direction.
+    """
     id = db.Column(db.Integer, primary_key=True)
-    amount = db.Column(db.Float, nullable=False)
+    amount_minor = db.Column(db.BigInteger, nullable=False)
     type = db.Column(db.String(10), nullable=False) 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    seq = db.Column(db.BigInteger)
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    __table_args__ = (db.Index('ix_transaction_user_seq', 'user_id', 'seq', unique=True),)
     
-    def __init__(self, amount, type, user_id):
-        self.amount = amount
+    def __init__(self, amount_minor, type, user_id):
+        self.amount_minor = amount_minor
         self.type = type
         self.user_id = user_id
 
+    @property
+    def amount(self) -> float:
+        return self.amount_minor / 100
+
+class BalanceCheckpoint(db.Model):
+    """
+    A user's balance right after ledger entry seq; seq 0 holds the balance before the first entry.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    seq = db.Column(db.BigInteger, primary_key=True)
+    balance_minor = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
 class Bet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    money_placed = db.Column(db.Float)
+    # stake and potential win in cents
+    stake_minor = db.Column(db.BigInteger)
     status = db.Column(db.String(16))
     odd = db.Column(db.Float, default=1.0)
-    win_amount = db.Column(db.Float)
+    win_minor = db.Column(db.BigInteger)
     date = db.Column(db.DateTime(timezone=True), default=func.now())
     user_won = db.Column(db.Boolean, default=None)
+    # current cash-out offer in cents, NULL while any leg is suspended
+    cashout_minor = db.Column(db.BigInteger)
+    cashout_updated_at = db.Column(db.DateTime(timezone=True))
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     bet_matches = db.relationship('BetMatch', backref='bet', cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_bet_user_date_id', 'user_id', 'date', 'id'),)
+
+    @property
+    def money_placed(self) -> float:
+        return (self.stake_minor or 0) / 100
+
+    @property
+    def win_amount(self) -> float:
+        return (self.win_minor or 0) / 100
+
 class Match(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     utc_date = db.Column(db.String(24), nullable=False)
+    kickoff_at = db.Column(db.DateTime, index=True)
+    kickoff_date = db.Column(db.Date, index=True)
     status = db.Column(db.String(20))
     stage = db.Column(db.String(50))
     group = db.Column(db.String(50))
@@ -65,10 +115,28 @@ class Match(db.Model):
     away_win_odd = db.Column(db.Float)
     draw_odd = db.Column(db.Float)
 
+    last_updated = db.Column(db.String(24))
+    payload_hash = db.Column(db.String(40))
+    version = db.Column(db.Integer, default=0, nullable=False)
+    finished_at = db.Column(db.DateTime(timezone=True), index=True)
+
     competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'))
+    home_team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
+    away_team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
+    # the two team ids in ascending order, so both fixtures of a pairing share one index range
+    team_pair_low = db.Column(db.Integer)
+    team_pair_high = db.Column(db.Integer)
     teams = db.relationship('Team', secondary=match_team, backref='matches')
+    home_team = db.relationship('Team', foreign_keys=[home_team_id])
+    away_team = db.relationship('Team', foreign_keys=[away_team_id])
     bet_match = db.relationship('BetMatch', backref='match', uselist=False)
 
+    __table_args__ = (
+        db.Index('ix_match_team_pair', 'team_pair_low', 'team_pair_high', 'kickoff_at'),
+        db.Index('ix_match_home_team_kickoff', 'home_team_id', 'kickoff_at'),
+        db.Index('ix_match_away_team_kickoff', 'away_team_id', 'kickoff_at'),
+    )
+
 class BetMatch(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     bet_id = db.Column(db.Integer, db.ForeignKey('bet.id'))
@@ -78,6 +146,15 @@ class BetMatch(db.Model):
     winner = db.Column(db.String())
     odd = db.Column(db.Float, nullable=False)
 
+class MatchLiability(db.Model):
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+    outcome = db.Column(db.String(10), primary_key=True)
+    open_bets = db.Column(db.Integer, nullable=False, default=0)
+    stake_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    payout_minor = db.Column(db.BigInteger, nullable=False, default=0, index=True)
+
+    match = db.relationship('Match')
+
 class Area(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
@@ -109,14 +186,109 @@ class Team(db.Model):
     short_name = db.Column(db.String(50))
     tla = db.Column(db.String(10))
     crest = db.Column(db.String(255))
+    # bumped when the name, short name, tla or crest change, cached match cards are keyed by it
+    version = db.Column(db.Integer, default=1, nullable=False)
+
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'))
+    venue = db.Column(db.String(100))
+    founded = db.Column(db.Integer)
+    club_colors = db.Column(db.String(100))
+    website = db.Column(db.String(255))
+    profile_updated_at = db.Column(db.DateTime(timezone=True), index=True)
+
+    area = db.relationship('Area')
+    coach = db.relationship('Coach', backref='team', uselist=False)
+    players = db.relationship('Player', secondary=team_player, backref='teams', order_by='(Player.position, Player.name)')
+
+class Coach(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), unique=True, nullable=False)
+    name = db.Column(db.String(100))
+    nationality = db.Column(db.String(50))
+    date_of_birth = db.Column(db.String(10))
+    contract_start = db.Column(db.String(7))
+    contract_until = db.Column(db.String(7))
+
+class Player(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
+    position = db.Column(db.String(50))
+    nationality = db.Column(db.String(50))
+    date_of_birth = db.Column(db.String(10))
+
+
+class Standing(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    stage = db.Column(db.String(50), nullable=False)
+    group = db.Column(db.String(50), nullable=False, default='')
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    position = db.Column(db.Integer)
+    played_games = db.Column(db.Integer, nullable=False, default=0)
+    won = db.Column(db.Integer, nullable=False, default=0)
+    draw = db.Column(db.Integer, nullable=False, default=0)
+    lost = db.Column(db.Integer, nullable=False, default=0)
+    goals_for = db.Column(db.Integer, nullable=False, default=0)
+    goals_against = db.Column(db.Integer, nullable=False, default=0)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    # most recent result first, e.g. "W,D,L,W,W"
+    form = db.Column(db.String(20))
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+    team = db.relationship('Team')
+
+    __table_args__ = (
+        db.UniqueConstraint('competition_id', 'stage', 'group', 'team_id'),
+        db.Index('ix_standing_table', 'competition_id', 'stage', 'group', 'position'),
+    )
+
+    @property
+    def goal_difference(self) -> int:
+        return self.goals_for - self.goals_against
+
+class ScorerSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    player_id = db.Column(db.Integer, nullable=False)
+    player_name = db.Column(db.String(100))
+    nationality = db.Column(db.String(50))
+    section = db.Column(db.String(50))
+    shirt_number = db.Column(db.Integer)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
+    played_matches = db.Column(db.Integer)
+    goals = db.Column(db.Integer)
+    assists = db.Column(db.Integer)
+    penalties = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+    team = db.relationship('Team')
+
+    __table_args__ = (db.Index('ix_scorer_snapshot_goals', 'competition_id', 'goals'),)
+
+
+class SyncCursor(db.Model):
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(64))
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+class SchedulerLease(db.Model):
+    name = db.Column(db.String(32), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False)
 
 
 class LotteryNumbers(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     numbers = db.Column(db.String, nullable=False) 
+    mask = db.Column(db.BigInteger, index=True, nullable=False)
+    prize_scale = db.Column(db.Float, default=1.0)
+    expected_payout = db.Column(db.Float)
 
-    def __init__(self, numbers):
-        self.numbers = ','.join(map(str, numbers))
+    def __init__(self, numbers, prize_scale=1.0, expected_payout=None):
+        self.numbers = ','.join(map(str, sorted(numbers)))
+        self.mask = numbers_to_mask(numbers)
+        self.prize_scale = prize_scale
+        self.expected_payout = expected_payout
 
     def get_numbers(self):
         return list(map(int, self.numbers.split(',')))
@@ -124,10 +296,15 @@ class LotteryNumbers(db.Model):
 class UserNumbers(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     numbers = db.Column(db.String, nullable=False)
+    # 0 for legacy tickets that were not 5 different numbers from 1 to 35, which cannot win
+    mask = db.Column(db.BigInteger, index=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  
+    # the draw the ticket was resolved in, NULL while it waits for the next draw
+    draw_id = db.Column(db.Integer, db.ForeignKey('lottery_numbers.id'), index=True)
 
     def __init__(self, numbers, user_id):
-        self.numbers = ','.join(map(str, numbers))
+        self.numbers = ','.join(map(str, sorted(numbers)))
+        self.mask = numbers_to_mask(numbers)
         self.user_id = user_id
 
     def get_numbers(self):
@@ -0,0 +1,147 @@
+"""
+Prices home/draw/away odds for upcoming matches from a Poisson model of team strengths
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+from sqlalchemy import bindparam, update
+
+from website.cursors import ODDS_SNAPSHOT_CURSOR, get_cursor, increment_cursor, set_cursor
+from website.models import Match
+from website.setup_db import db
+
+ODDS_MARGIN = float(os.getenv("ODDS_MARGIN", "0.05"))
+MAX_GOALS = 10
+# pseudo-games of league-average form added to every team, so short histories stay near the mean
+PRIOR_GAMES = 5.0
+DEFAULT_HOME_GOALS = 1.5
+DEFAULT_AWAY_GOALS = 1.2
+MIN_ODD = 1.01
+MIN_GOAL_RATE = 0.05
+UPCOMING_STATUSES = ('SCHEDULED', 'TIMED')
+
+_goals = np.arange(MAX_GOALS + 1)
+_log_factorials = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, MAX_GOALS + 1)))))
+
+
+def get_team_strengths(home_ids: np.ndarray, away_ids: np.ndarray, home_goals: np.ndarray,
+                       away_goals: np.ndarray, team_ids: np.ndarray) -> tuple:
+    """
+    Returns the attack and defence multipliers for team_ids (sorted) plus the
+    average home and away goals, from the finished results given as arrays.
+    """
+    mean_home = (home_goals.sum() + PRIOR_GAMES * DEFAULT_HOME_GOALS) / (len(home_goals) + PRIOR_GAMES)
+    mean_away = (away_goals.sum() + PRIOR_GAMES * DEFAULT_AWAY_GOALS) / (len(away_goals) + PRIOR_GAMES)
+    mean_goals = (mean_home + mean_away) / 2
+
+    size = len(team_ids)
+    home_index = np.searchsorted(team_ids, home_ids)
+    away_index = np.searchsorted(team_ids, away_ids)
+
+    games = np.bincount(home_index, minlength=size) + np.bincount(away_index, minlength=size)
+    scored = (np.bincount(home_index, home_goals, minlength=size)
+              + np.bincount(away_index, away_goals, minlength=size))
+    conceded = (np.bincount(home_index, away_goals, minlength=size)
+                + np.bincount(away_index, home_goals, minlength=size))
+
+    prior = PRIOR_GAMES * mean_goals
+    attack = (scored + prior) / (games + PRIOR_GAMES) / mean_goals
+    defence = (conceded + prior) / (games + PRIOR_GAMES) / mean_goals
+    return attack, defence, mean_home, mean_away
+
+def get_outcome_probabilities(home_rates: np.ndarray, away_rates: np.ndarray) -> np.ndarray:
+    """
+    Returns an (n, 3) array of home/draw/away probabilities for n pairs of expected goals.
+    """
+    home_pmf = np.exp(_goals * np.log(home_rates)[:, None] - home_rates[:, None] - _log_factorials)
+    away_pmf = np.exp(_goals * np.log(away_rates)[:, None] - away_rates[:, None] - _log_factorials)
+    # P(other side scored fewer than k goals) for every k
+    away_below = np.cumsum(away_pmf, axis=1) - away_pmf
+    home_below = np.cumsum(home_pmf, axis=1) - home_pmf
+
+    probabilities = np.stack([
+        (home_pmf * away_below).sum(axis=1),
+        (home_pmf * away_pmf).sum(axis=1),
+        (away_pmf * home_below).sum(axis=1),
+    ], axis=1)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+def get_odds(probabilities: np.ndarray, margin: float = ODDS_MARGIN) -> np.ndarray:
+    return np.maximum(np.round(1 / (probabilities * (1 + margin)), 2), MIN_ODD)
+
+def price_matches(finished: np.ndarray, upcoming: np.ndarray, margin: float = ODDS_MARGIN) -> np.ndarray:
+    """
+    finished holds (home id, away id, home goals, away goals) rows and upcoming holds
+    (home id, away id) rows. Returns (home, draw, away) odds for every upcoming row.
+    """
+    team_ids = np.unique(np.concatenate([finished[:, :2].ravel(), upcoming.ravel()]))
+    attack, defence, mean_home, mean_away = get_team_strengths(
+        finished[:, 0], finished[:, 1], finished[:, 2].astype(float), finished[:, 3].astype(float), team_ids)
+
+    home_index = np.searchsorted(team_ids, upcoming[:, 0])
+    away_index = np.searchsorted(team_ids, upcoming[:, 1])
+    home_rates = np.maximum(mean_home * attack[home_index] * defence[away_index], MIN_GOAL_RATE)
+    away_rates = np.maximum(mean_away * attack[away_index] * defence[home_index], MIN_GOAL_RATE)
+
+    return get_odds(get_outcome_probabilities(home_rates, away_rates), margin)
+
+def get_inputs_signature(finished: np.ndarray, upcoming_ids: np.ndarray, margin: float) -> str:
+    digest = hashlib.sha1(np.ascontiguousarray(finished, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(upcoming_ids, dtype=np.int64).tobytes())
+    digest.update(str(margin).encode())
+    return digest.hexdigest()
+
+def reprice_competition(competition_id: int, margin: float = ODDS_MARGIN, force: bool = False) -> int:
+    """
+    Re-prices the competition's upcoming matches when its finished results or its
+    fixture list changed since the last run, writing only odds that moved.
+    """
+    started = time.perf_counter()
+
+    finished = np.array(db.session.query(Match.home_team_id, Match.away_team_id,
+                                         Match.full_time_home, Match.full_time_away)
+                        .filter(Match.competition_id == competition_id, Match.status == 'FINISHED',
+                                Match.home_team_id.isnot(None), Match.away_team_id.isnot(None),
+                                Match.full_time_home.isnot(None), Match.full_time_away.isnot(None))
+                        .order_by(Match.id)
+                        .all(), dtype=np.int64).reshape(-1, 4)
+    upcoming_rows = (db.session.query(Match.id, Match.home_team_id, Match.away_team_id,
+                                      Match.home_win_odd, Match.draw_odd, Match.away_win_odd)
+                     .filter(Match.competition_id == competition_id, Match.status.in_(UPCOMING_STATUSES),
+                             Match.home_team_id.isnot(None), Match.away_team_id.isnot(None))
+                     .order_by(Match.id)
+                     .all())
+    if not upcoming_rows:
+        return 0
+
+    upcoming = np.array([row[:3] for row in upcoming_rows], dtype=np.int64)
+    current = np.array([row[3:] for row in upcoming_rows], dtype=float)
+
+    cursor_name = f"odds:{competition_id}"
+    signature = get_inputs_signature(finished, upcoming[:, 0], margin)
+    if not force and get_cursor(cursor_name) == signature:
+        return 0
+
+    odds = price_matches(finished, upcoming[:, 1:], margin)
+    changed = ~np.isclose(np.nan_to_num(current, nan=0.0), odds).all(axis=1)
+
+    if changed.any():
+        matches = Match.__table__
+        db.session.execute(
+            update(matches)
+            .where(matches.c.id == bindparam('b_id'))
+            .values(home_win_odd=bindparam('b_home'), draw_odd=bindparam('b_draw'), away_win_odd=bindparam('b_away'),
+                    version=matches.c.version + 1),
+            [{'b_id': int(match_id), 'b_home': float(home), 'b_draw': float(draw), 'b_away': float(away)}
+             for match_id, (home, draw, away) in zip(upcoming[changed, 0], odds[changed])]
+        )
+        increment_cursor(ODDS_SNAPSHOT_CURSOR)
+    set_cursor(cursor_name, signature)
+    db.session.commit()
+
+    repriced = int(changed.sum())
+    print(f"Priced {len(upcoming)} matches for competition {competition_id}, {repriced} changed, "
+          f"in {round(time.perf_counter() - started, 3)}s")
+    return repriced
@@ -0,0 +1,102 @@
+"""
+Process-local, versioned snapshot of the odds, status and team names of every match open for betting,
+used to price and validate selections without a database round trip. The sync jobs bump a cursor in
+the same transaction as their writes; readers poll it every few seconds and swap in a fresh snapshot
+"""
+from datetime import datetime
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from website.cursors import ODDS_SNAPSHOT_CURSOR, get_cursor
+from website.models import Match, Team
+from website.odds_engine import UPCOMING_STATUSES
+from website.setup_db import db
+
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("ODDS_SNAPSHOT_CHECK_SECONDS", "2"))
+ODDS_COLUMNS = {'HOME_TEAM': 'home_win_odd', 'DRAW': 'draw_odd', 'AWAY_TEAM': 'away_win_odd'}
+
+
+class MatchQuote:
+    __slots__ = ("match_id", "version", "status", "kickoff_at", "home_win_odd", "draw_odd", "away_win_odd",
+                 "home_team", "away_team")
+
+    def __init__(self, row):
+        self.match_id = row.id
+        self.version = row.version
+        self.status = row.status
+        self.kickoff_at = row.kickoff_at
+        self.home_win_odd = row.home_win_odd
+        self.draw_odd = row.draw_odd
+        self.away_win_odd = row.away_win_odd
+        self.home_team = row.home_team
+        self.away_team = row.away_team
+
+    def get_odd(self, winner: str) -> Optional[float]:
+        column = ODDS_COLUMNS.get(winner)
+        if column is None:
+            raise ValueError("Unknown outcome")
+        return getattr(self, column)
+
+
+class OddsSnapshot:
+    def __init__(self, version: Optional[str], quotes: dict[int, MatchQuote]):
+        self.version = version
+        self.quotes = quotes
+
+    def find_quote(self, match_id: int) -> Optional[MatchQuote]:
+        """
+        Returns the match's quote while it is open for betting. Kickoff is re-checked here
+        because a match stays in the snapshot until the next sync changes its status.
+        """
+        quote = self.quotes.get(match_id)
+        if quote is None or quote.kickoff_at <= datetime.utcnow():
+            return None
+        return quote
+
+    def get_quote(self, match_id: int) -> MatchQuote:
+        quote = self.find_quote(match_id)
+        if quote is None:
+            raise ValueError(f"Match {match_id} is not open for betting")
+        return quote
+
+
+_snapshot = OddsSnapshot(None, {})
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def load_snapshot(version: Optional[str]) -> OddsSnapshot:
+    home_team = aliased(Team)
+    away_team = aliased(Team)
+    rows = db.session.execute(
+        select(Match.id, Match.version, Match.status, Match.kickoff_at,
+               Match.home_win_odd, Match.draw_odd, Match.away_win_odd,
+               home_team.short_name.label('home_team'), away_team.short_name.label('away_team'))
+        .outerjoin(home_team, home_team.id == Match.home_team_id)
+        .outerjoin(away_team, away_team.id == Match.away_team_id)
+        .where(Match.status.in_(UPCOMING_STATUSES), Match.kickoff_at > datetime.utcnow())
+    ).all()
+    return OddsSnapshot(version, {row.id: MatchQuote(row) for row in rows})
+
+def get_snapshot(refresh: bool = False) -> OddsSnapshot:
+    """
+    Returns the current snapshot, reloading it when the cursor moved. The cursor is read at
+    most every SNAPSHOT_CHECK_SECONDS, so between checks this never touches the database.
+    """
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if not refresh and now - _checked_at < SNAPSHOT_CHECK_SECONDS:
+        return _snapshot
+
+    with _lock:
+        if refresh or now - _checked_at >= SNAPSHOT_CHECK_SECONDS:
+            version = get_cursor(ODDS_SNAPSHOT_CURSOR)
+            if version != _snapshot.version or _snapshot.version is None:
+                _snapshot = load_snapshot(version)
+            _checked_at = now
+    return _snapshot
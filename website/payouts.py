@@ -0,0 +1,45 @@
+"""
+Credits winnings to user balances in aggregated batches
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import bindparam, select, update
+
+from website.balances import record_entries
+from website.models import User
+from website.setup_db import db
+
+
+def aggregate_credits(credits: Iterable[tuple[int, int]]) -> dict[int, int]:
+    """
+    Sums (user_id, amount_minor) credits into one amount per user.
+    """
+    totals = defaultdict(int)
+    for user_id, amount_minor in credits:
+        if amount_minor:
+            totals[user_id] += amount_minor
+    return dict(totals)
+
+def apply_payouts(credits: dict[int, int], transaction_type: str) -> int:
+    """
+    Adds one aggregated amount in minor units per user to the balance and writes the
+    matching ledger entries. Does not commit, so the caller can include it in its own transaction.
+    """
+    if not credits:
+        return 0
+
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == bindparam('b_user_id'))
+        .values(balance_minor=users.c.balance_minor + bindparam('b_amount'), ledger_seq=users.c.ledger_seq + 1),
+        [{'b_user_id': user_id, 'b_amount': amount} for user_id, amount in credits.items()]
+    )
+    # the updates hold the write lock, so these are the balances and seqs they produced
+    rows = db.session.execute(
+        select(users.c.id, users.c.balance_minor, users.c.ledger_seq).where(users.c.id.in_(list(credits)))
+    ).all()
+    record_entries([{'user_id': row.id, 'amount_minor': credits[row.id], 'type': transaction_type,
+                     'seq': row.ledger_seq, 'balance_minor': row.balance_minor} for row in rows])
+    return len(credits)
@@ -2,30 +2,25 @@
 Functions that generates random numbers
 """
 import random
+from sqlalchemy import case, literal, update
+from website.balances import to_minor
+from website.lottery import LOTTERY_PRIZES, MIN_WINNING_HITS, mask_to_numbers
 from website.setup_db import db
 from website.models import LotteryNumbers, User, UserNumbers
-
-
-def generate_normalized_odds():
-    probabilities = [random.random() for _ in range(3)]
-    
-    total = sum(probabilities)
-    normalized_probabilities = [p / total for p in probabilities]
-    
-    odds = [round(1 / p, 2) for p in normalized_probabilities]
-    
-    return  odds
-
+from website.payouts import aggregate_credits, apply_payouts
 
 
 def generate_five_numbers():
     return random.sample(range(1, 36), 5)
 
-def draw_lottery_numbers():
-    numbers = generate_five_numbers()
-    lottery_entry = LotteryNumbers(numbers)
+def draw_lottery_numbers(prize_scale: float = 1.0, expected_payout: float = None) -> LotteryNumbers:
+    """
+    Adds a new draw without committing, so it can be resolved in the same transaction.
+    """
+    lottery_entry = LotteryNumbers(generate_five_numbers(), prize_scale, expected_payout)
     db.session.add(lottery_entry)
-    db.session.commit()
+    db.session.flush()
+    return lottery_entry
 
 def get_latest_lottery_numbers():
     latest_lottery = LotteryNumbers.query.order_by(LotteryNumbers.id.desc()).first()
@@ -34,23 +29,31 @@ def get_latest_lottery_numbers():
     else:
         return None 
 
-def check_user_numbers_against_lottery():
-    latest_lottery_numbers = get_latest_lottery_numbers()
-    if not latest_lottery_numbers:
-        print("No lottery numbers available for comparison.")
-        return []
-
-    all_user_numbers = UserNumbers.query.all()
-    winning_users = []
-
-    for user_numbers_entry in all_user_numbers:
-        user_numbers = user_numbers_entry.get_numbers()
-        if set(user_numbers) == set(latest_lottery_numbers):
-            winning_users.append(user_numbers_entry.user_id)
-            user = User.query.get(user_numbers_entry.user_id)
-            user.balance += 30000
-            db.session.commit()
-
-    return winning_users
-
-
+def get_ticket_hits_query(draw: LotteryNumbers):
+    drawn_bits = [1 << (number - 1) for number in mask_to_numbers(draw.mask)]
+    hits = sum((case((UserNumbers.mask.op('&')(bit) != 0, 1), else_=0) for bit in drawn_bits), literal(0))
+
+    return (db.session.query(UserNumbers.user_id, hits.label('hits'))
+            .filter(UserNumbers.draw_id == draw.id)
+            .filter(UserNumbers.mask.op('&')(draw.mask) != 0)
+            .filter(hits >= MIN_WINNING_HITS))
+
+def get_jackpot_winners(draw: LotteryNumbers) -> list:
+    return (db.session.query(User.email, UserNumbers.numbers)
+            .join(UserNumbers, UserNumbers.user_id == User.id)
+            .filter(UserNumbers.draw_id == draw.id, UserNumbers.mask == draw.mask)
+            .all())
+
+def resolve_lottery_draw(draw: LotteryNumbers) -> list:
+    """
+    Enters every unresolved ticket into the draw and credits the prizes. Tickets bought
+    afterwards wait for the next draw. Does not commit.
+    """
+    tickets = UserNumbers.__table__
+    db.session.execute(update(tickets).where(tickets.c.draw_id.is_(None)).values(draw_id=draw.id))
+
+    prize_scale = draw.prize_scale or 1.0
+    winning_tickets = [(row.user_id, row.hits) for row in get_ticket_hits_query(draw).all()]
+    apply_payouts(aggregate_credits((user_id, to_minor(LOTTERY_PRIZES[hits] * prize_scale))
+                                    for user_id, hits in winning_tickets), 'lottery')
+    return winning_tickets
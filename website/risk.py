@@ -0,0 +1,36 @@
+"""
+Read-only risk endpoints over the match liability totals, open to admins only
+"""
+import os
+from functools import wraps
+
+from flask import Blueprint, abort, jsonify, request
+from flask_login import current_user, login_required
+
+from website.liability import DEFAULT_TOP_EXPOSURES, get_top_exposures
+
+MAX_TOP_EXPOSURES = 200
+# comma separated emails of the users allowed to see the risk endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+risk = Blueprint('risk', __name__)
+
+
+def is_admin(user) -> bool:
+    return bool(user.is_authenticated and user.email and user.email.lower() in ADMIN_EMAILS)
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not is_admin(current_user):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@risk.route('/risk/exposure')
+@admin_required
+def top_exposure():
+    limit = min(request.args.get('limit', DEFAULT_TOP_EXPOSURES, type=int), MAX_TOP_EXPOSURES)
+    return jsonify(get_top_exposures(max(limit, 1)))
@@ -0,0 +1,76 @@
+"""
+Single-leader lease for the scheduler and per-job overlap protection
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import socket
+import threading
+import uuid
+from typing import Callable
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from website.metrics import time_job
+from website.models import SchedulerLease
+from website.setup_db import db
+
+LEASE_NAME = "scheduler"
+LEASE_TTL = timedelta(seconds=int(os.getenv("SCHEDULER_LEASE_TTL", "90")))
+LEASE_RENEW_SECONDS = 30
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_job_locks: dict[str, threading.Lock] = {}
+_job_locks_guard = threading.Lock()
+
+
+def acquire_leadership() -> bool:
+    """
+    Takes or renews the scheduler lease. Succeeds when the lease is free,
+    expired or already held by this process.
+    """
+    now = datetime.now(timezone.utc)
+    leases = SchedulerLease.__table__
+
+    stmt = sqlite_insert(leases).values(name=LEASE_NAME, owner=OWNER_ID, expires_at=now + LEASE_TTL)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[leases.c.name],
+        set_={'owner': stmt.excluded.owner, 'expires_at': stmt.excluded.expires_at},
+        where=or_(leases.c.owner == OWNER_ID, leases.c.expires_at < now)
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+    owner = db.session.query(SchedulerLease.owner).filter_by(name=LEASE_NAME).scalar()
+    return owner == OWNER_ID
+
+def release_leadership() -> None:
+    SchedulerLease.query.filter_by(name=LEASE_NAME, owner=OWNER_ID).delete()
+    db.session.commit()
+
+def get_job_lock(job_id: str) -> threading.Lock:
+    with _job_locks_guard:
+        if job_id not in _job_locks:
+            _job_locks[job_id] = threading.Lock()
+        return _job_locks[job_id]
+
+def run_exclusive(job_id: str, func: Callable[[], None]) -> bool:
+    """
+    Runs a job only when this process is the scheduler leader and the
+    previous run of the same job has finished. Needs an app context.
+    """
+    if not acquire_leadership():
+        return False
+
+    lock = get_job_lock(job_id)
+    if not lock.acquire(blocking=False):
+        print(f"{job_id} is still running, skipping this run")
+        return False
+
+    try:
+        with time_job(func.__name__):
+            func()
+    finally:
+        lock.release()
+    return True
@@ -0,0 +1,250 @@
+"""
+Startup schema upgrades for databases created by an older version of the models. create_all only
+creates missing tables, so missing columns and indexes are added here and existing rows backfilled
+"""
+from datetime import datetime, timezone
+from itertools import groupby
+
+from sqlalchemy import (Column, Integer, MetaData, Table, bindparam, cast, delete, func, insert, inspect, literal,
+                        literal_column, select, text, update)
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+from website.balances import CHECKPOINT_INTERVAL, get_signed_amount
+from website.fixtures import parse_utc_date
+from website.lottery import numbers_to_mask
+from website.models import BalanceCheckpoint, Bet, BetMatch, LotteryNumbers, Match, Player, Transaction, User, UserNumbers, team_player
+from website.setup_db import db
+
+# float currency columns of older databases and the cents columns that replaced them
+MONEY_COLUMNS = {
+    User.__table__: (('balance', 'balance_minor'),),
+    Transaction.__table__: (('amount', 'amount_minor'),),
+    Bet.__table__: (('money_placed', 'stake_minor'), ('win_amount', 'win_minor')),
+}
+
+def get_default_sql(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def get_column_ddl(column: Column) -> str:
+    """
+    SQLite only adds NOT NULL columns that have a default, other columns are added nullable.
+    """
+    dialect = db.engine.dialect
+    ddl = f"{dialect.identifier_preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" DEFAULT {get_default_sql(column.default.arg)}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+def get_column_names(connection: Connection, table: Table) -> set[str]:
+    return {column['name'] for column in inspect(connection).get_columns(table.name)}
+
+def add_missing_columns(connection: Connection, table: Table) -> list[str]:
+    existing = get_column_names(connection, table)
+    added = []
+    for column in table.columns:
+        if column.name not in existing:
+            connection.execute(text(f"ALTER TABLE {db.engine.dialect.identifier_preparer.format_table(table)} "
+                                    f"ADD COLUMN {get_column_ddl(column)}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+def is_nullable(connection: Connection, table: Table, column_name: str) -> bool:
+    return any(column['name'] == column_name and column['nullable']
+               for column in inspect(connection).get_columns(table.name))
+
+def rebuild_table(connection: Connection, table: Table) -> None:
+    """
+    Recreates a table from its model and copies the shared columns over, which is how SQLite
+    changes constraints. Its indexes are recreated afterwards by upgrade_schema.
+    """
+    preparer = db.engine.dialect.identifier_preparer
+    existing = get_column_names(connection, table)
+    columns = ', '.join(preparer.format_column(column) for column in table.columns if column.name in existing)
+    # copied next to the other tables so its foreign keys still resolve
+    metadata = MetaData()
+    for other in db.metadata.sorted_tables:
+        if other is not table:
+            other.to_metadata(metadata)
+    rebuilt = table.to_metadata(metadata, name=f"{table.name}_rebuild")
+
+    connection.execute(CreateTable(rebuilt))
+    connection.execute(text(f"INSERT INTO {preparer.format_table(rebuilt)} ({columns}) "
+                            f"SELECT {columns} FROM {preparer.format_table(table)}"))
+    connection.execute(text(f"DROP TABLE {preparer.format_table(table)}"))
+    connection.execute(text(f"ALTER TABLE {preparer.format_table(rebuilt)} RENAME TO {preparer.format_table(table)}"))
+    print(f"Rebuilt table {table.name}")
+
+def get_legacy_mask(numbers: str) -> int:
+    try:
+        return numbers_to_mask(int(number) for number in numbers.split(','))
+    except ValueError:
+        return 0
+
+def backfill_lottery_masks(connection: Connection) -> None:
+    """
+    Fills the masks of draws and tickets stored as comma separated numbers only, then makes
+    the column NOT NULL. Tickets that were never valid get mask 0 and cannot win.
+    """
+    for table in (LotteryNumbers.__table__, UserNumbers.__table__):
+        rows = connection.execute(select(table.c.id, table.c.numbers).where(table.c.mask.is_(None))).all()
+        if rows:
+            connection.execute(update(table).where(table.c.id == bindparam('b_id')).values(mask=bindparam('b_mask')),
+                               [{'b_id': row.id, 'b_mask': get_legacy_mask(row.numbers)} for row in rows])
+            print(f"Backfilled {len(rows)} {table.name} masks")
+        if is_nullable(connection, table, 'mask'):
+            rebuild_table(connection, table)
+
+def migrate_player_teams(connection: Connection) -> None:
+    """
+    Moves the single Player.team_id of older databases into the team_player squad links.
+    """
+    players = Player.__table__
+    if 'team_id' not in get_column_names(connection, players):
+        return
+    connection.execute(text(f"INSERT OR IGNORE INTO {team_player.name} (team_id, player_id) "
+                            f"SELECT team_id, id FROM {players.name} WHERE team_id IS NOT NULL"))
+    rebuild_table(connection, players)
+
+def convert_money_columns(connection: Connection) -> None:
+    """
+    Moves amounts stored as float currency into the cents columns that replaced them, then
+    rebuilds the table without the float columns. Rows written since the cents columns were
+    added keep what they hold, which for balances is added to the converted amount.
+    """
+    for table, columns in MONEY_COLUMNS.items():
+        legacy = [(old, new) for old, new in columns if old in get_column_names(connection, table)]
+        if not legacy:
+            continue
+        connection.execute(update(table).values({
+            new: func.coalesce(table.c[new], 0)
+                 + cast(func.round(func.coalesce(literal_column(f'"{old}"'), 0) * 100), Integer)
+            for old, new in legacy}))
+        print(f"Converted {', '.join(f'{table.name}.{old}' for old, _ in legacy)} to cents")
+        rebuild_table(connection, table)
+
+def backfill_kickoffs(connection: Connection) -> int:
+    """
+    Fills the kickoff columns of matches stored before they existed, which the fixture queries filter on.
+    """
+    matches = Match.__table__
+    rows = connection.execute(
+        select(matches.c.id, matches.c.utc_date).where(matches.c.kickoff_at.is_(None), matches.c.utc_date.isnot(None))
+    ).all()
+    if rows:
+        kickoffs = [(row.id, parse_utc_date(row.utc_date)) for row in rows]
+        connection.execute(
+            update(matches).where(matches.c.id == bindparam('b_id'))
+            .values(kickoff_at=bindparam('b_kickoff_at'), kickoff_date=bindparam('b_kickoff_date')),
+            [{'b_id': match_id, 'b_kickoff_at': kickoff_at, 'b_kickoff_date': kickoff_at.date()}
+             for match_id, kickoff_at in kickoffs])
+    return len(rows)
+
+def backfill_finished_at(connection: Connection) -> int:
+    """
+    Stamps matches that finished before finished_at existed, so settlement picks up their bets.
+    """
+    matches = Match.__table__
+    return connection.execute(
+        update(matches)
+        .where(matches.c.status == 'FINISHED', matches.c.finished_at.is_(None))
+        .values(finished_at=datetime.now(timezone.utc))
+    ).rowcount
+
+def delete_pending_bets(connection: Connection) -> int:
+    """
+    Drops the unstaked PENDING bets the old per-click slip wrote to the database. Slips now live
+    in the session and a PENDING bet holds no money, so nothing is lost but the selections.
+    """
+    bets, bet_matches = Bet.__table__, BetMatch.__table__
+    pending = select(bets.c.id).where(bets.c.status == 'PENDING')
+    connection.execute(delete(bet_matches).where(bet_matches.c.bet_id.in_(pending)))
+    return connection.execute(delete(bets).where(bets.c.status == 'PENDING')).rowcount
+
+def backfill_ledger(connection: Connection) -> int:
+    """
+    Numbers the transactions written before the ledger existed in id order per user and rewrites
+    the user's checkpoints from the current balance; the opening checkpoint absorbs the balance
+    changes older versions made without a transaction. Their times are unknown, so they get the
+    upgrade time. Users with a balance but no transactions get an opening checkpoint only.
+    """
+    transactions, users, checkpoints = Transaction.__table__, User.__table__, BalanceCheckpoint.__table__
+    now = datetime.now(timezone.utc)
+    user_ids = connection.execute(
+        select(transactions.c.user_id)
+        .where(transactions.c.seq.is_(None), transactions.c.user_id.isnot(None))
+        .distinct()
+    ).scalars().all()
+
+    if user_ids:
+        connection.execute(update(transactions).where(transactions.c.created_at.is_(None)).values(created_at=now))
+        # cleared first so renumbering never collides on the (user_id, seq) index
+        connection.execute(update(transactions).where(transactions.c.user_id.in_(user_ids)).values(seq=None))
+        connection.execute(delete(checkpoints).where(checkpoints.c.user_id.in_(user_ids)))
+        balances = dict(connection.execute(select(users.c.id, users.c.balance_minor).where(users.c.id.in_(user_ids))).all())
+        entries = connection.execute(
+            select(transactions.c.id, transactions.c.user_id, transactions.c.type, transactions.c.amount_minor)
+            .where(transactions.c.user_id.in_(user_ids))
+            .order_by(transactions.c.user_id, transactions.c.id)
+        ).all()
+
+        seq_rows, checkpoint_rows, user_rows = [], [], []
+        for user_id, user_entries in groupby(entries, key=lambda entry: entry.user_id):
+            user_entries = list(user_entries)
+            signed = [get_signed_amount(entry.amount_minor or 0, entry.type) for entry in user_entries]
+            balance_minor = (balances.get(user_id) or 0) - sum(signed)
+            checkpoint_rows.append({'user_id': user_id, 'seq': 0, 'balance_minor': balance_minor, 'created_at': now})
+            for seq, (entry, amount_minor) in enumerate(zip(user_entries, signed), start=1):
+                balance_minor += amount_minor
+                seq_rows.append({'b_id': entry.id, 'b_seq': seq})
+                if seq % CHECKPOINT_INTERVAL == 0:
+                    checkpoint_rows.append({'user_id': user_id, 'seq': seq, 'balance_minor': balance_minor,
+                                            'created_at': now})
+            user_rows.append({'b_id': user_id, 'b_seq': len(user_entries)})
+
+        connection.execute(update(transactions).where(transactions.c.id == bindparam('b_id'))
+                           .values(seq=bindparam('b_seq')), seq_rows)
+        connection.execute(update(users).where(users.c.id == bindparam('b_id'))
+                           .values(ledger_seq=bindparam('b_seq')), user_rows)
+        connection.execute(insert(checkpoints), checkpoint_rows)
+
+    connection.execute(insert(checkpoints).from_select(
+        ['user_id', 'seq', 'balance_minor', 'created_at'],
+        select(users.c.id, literal(0), users.c.balance_minor, literal(now, type_=checkpoints.c.created_at.type))
+        .where(users.c.ledger_seq == 0, users.c.balance_minor != 0,
+               ~select(checkpoints.c.user_id).where(checkpoints.c.user_id == users.c.id).exists())))
+    return len(user_ids)
+
+def upgrade_schema() -> None:
+    with db.engine.begin() as connection:
+        added = []
+        for table in db.metadata.sorted_tables:
+            added += add_missing_columns(connection, table)
+        backfill_lottery_masks(connection)
+        migrate_player_teams(connection)
+        convert_money_columns(connection)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+        kickoffs = backfill_kickoffs(connection)
+        finished = backfill_finished_at(connection)
+        pending = delete_pending_bets(connection)
+        ledgers = backfill_ledger(connection)
+
+    if added:
+        print(f"Added columns {', '.join(added)}")
+    if kickoffs:
+        print(f"Backfilled kickoff times for {kickoffs} matches")
+    if finished:
+        print(f"Backfilled finished_at for {finished} matches")
+    if pending:
+        print(f"Deleted {pending} unstaked pending bets")
+    if ledgers:
+        print(f"Backfilled ledger entries for {ledgers} users")
@@ -0,0 +1,92 @@
+"""
+Settles placed bets whose matches have newly finished since the previous run
+"""
+from datetime import datetime, timedelta, timezone
+import time
+
+from sqlalchemy import and_, case, func, select, update
+
+from website.cursors import get_cursor_time, set_cursor_time
+from website.liability import release_bet_liability
+from website.models import Bet, BetMatch, Match
+from website.payouts import aggregate_credits, apply_payouts
+from website.setup_db import db
+
+SETTLEMENT_CURSOR = "settlement"
+BATCH_SIZE = 500
+# matches are stamped finished_at before the sync transaction commits, so each run
+# re-checks a short overlap; already settled bets are excluded by their status
+SETTLEMENT_OVERLAP = timedelta(minutes=15)
+
+
+def get_newly_finished_match_ids(since, until) -> select:
+    query = select(Match.id).where(Match.finished_at.isnot(None), Match.finished_at <= until)
+    if since is not None:
+        query = query.where(Match.finished_at > since)
+    return query
+
+def get_settleable_bets(finished_match_ids: select) -> list:
+    affected_bet_ids = select(BetMatch.bet_id).where(BetMatch.match_id.in_(finished_match_ids))
+    is_finished = Match.status == 'FINISHED'
+
+    return (db.session.query(
+                BetMatch.bet_id,
+                Bet.user_id,
+                Bet.win_minor,
+                func.count(BetMatch.id).label('legs'),
+                func.sum(case((is_finished, 1), else_=0)).label('finished'),
+                func.sum(case((and_(is_finished, BetMatch.winner == Match.winner), 1), else_=0)).label('won'))
+            .join(Match, Match.id == BetMatch.match_id)
+            .join(Bet, Bet.id == BetMatch.bet_id)
+            .filter(Bet.status == 'PLACED', BetMatch.bet_id.in_(affected_bet_ids))
+            .group_by(BetMatch.bet_id, Bet.user_id, Bet.win_minor)
+            .having(func.count(BetMatch.id) == func.sum(case((is_finished, 1), else_=0)))
+            .all())
+
+def mark_bets_finished(rows: list, user_won: bool) -> int:
+    settled = 0
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch = {row.bet_id: row for row in rows[i:i + BATCH_SIZE]}
+        settled_ids = db.session.execute(
+            update(Bet)
+            .where(Bet.id.in_(batch.keys()), Bet.status == 'PLACED')
+            .values(status='FINISHED', user_won=user_won)
+            .returning(Bet.id)
+        ).scalars().all()
+
+        release_bet_liability(settled_ids)
+        if user_won:
+            apply_payouts(aggregate_credits((batch[bet_id].user_id, batch[bet_id].win_minor)
+                                            for bet_id in settled_ids), 'payout')
+        db.session.commit()
+        settled += len(settled_ids)
+    return settled
+
+def settle_bets() -> dict:
+    started = time.perf_counter()
+    since = get_cursor_time(SETTLEMENT_CURSOR)
+    if since is not None:
+        since -= SETTLEMENT_OVERLAP
+    until = datetime.now(timezone.utc)
+
+    rows = get_settleable_bets(get_newly_finished_match_ids(since, until))
+    won = [row for row in rows if row.won == row.legs]
+    lost = [row for row in rows if row.won != row.legs]
+
+    settled = mark_bets_finished(won, True) + mark_bets_finished(lost, False)
+
+    set_cursor_time(SETTLEMENT_CURSOR, until)
+    db.session.commit()
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'settled': settled,
+        'won': len(won),
+        'lost': len(lost),
+        'seconds': round(seconds, 3),
+        'per_second': round(settled / seconds, 1) if seconds > 0 else 0.0,
+    }
+    if settled:
+        print(f"Settled {settled} bets ({stats['won']} won, {stats['lost']} lost) "
+              f"in {stats['seconds']}s, {stats['per_second']} bets/s")
+    return stats
@@ -3,20 +3,27 @@ Set up the flask web application and database
 """
 from datetime import datetime
 import os
+from typing import Optional
 from flask import Flask
 from flask_login import LoginManager
 from dotenv import load_dotenv
 from website.setup_scheduler import init_scheduler
+from .metrics import init_metrics
 from .setup_db import init_database, create_database
 from .views import views
 from .auth import auth
 from .bets import bets
+from .risk import risk
 from .transactions import transactions
 from . import models
 
 load_dotenv()
 
-def create_app() -> Flask:
+def create_app(start_scheduler: Optional[bool] = None) -> Flask:
+    """
+    Web workers should pass start_scheduler=False (or set RUN_SCHEDULER=0)
+    and leave the jobs to `python -m website.worker`.
+    """
     app = Flask(__name__)
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "default_secret_key")
     init_database(app)
@@ -27,6 +34,8 @@ def create_app() -> Flask:
     app.register_blueprint(auth, url_prefix='/')
     app.register_blueprint(bets, ulr_prefix='/bets')
     app.register_blueprint(transactions, ulr_prefix='/transactions')
+    app.register_blueprint(risk)
+    init_metrics(app)
     
     create_database(app)
 
@@ -48,6 +57,9 @@ def create_app() -> Flask:
             return age
         return None
     
-    init_scheduler(app)
+    if start_scheduler is None:
+        start_scheduler = os.getenv("RUN_SCHEDULER", "1") == "1"
+    if start_scheduler:
+        init_scheduler(app)
 
     return app
@@ -3,7 +3,6 @@ Set up database
 """
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from os import path
 
 db = SQLAlchemy()
 DB_NAME = "database.db"
@@ -13,10 +12,11 @@ def init_database(app: Flask) -> None:
     db.init_app(app)    
     
 def create_database(app: Flask) -> None:
-    db_path = path.join("..", "instance", DB_NAME)
-    if not path.exists(db_path):
-        with app.app_context():
-            db.create_all()
-            print("Database Created")
-        return
-    print("Database already exists")
\ No newline at end of file
+    """
+    Creates missing tables and upgrades tables created by older models.
+    """
+    from website.schema import upgrade_schema
+
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
\ No newline at end of file
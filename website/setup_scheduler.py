@@ -1,33 +1,37 @@
 """
 Functions that need to run endlessly while the web application is working and setting up scheduler for the web application
 """
+from datetime import date, datetime, timedelta, timezone
 import time
-from sqlalchemy.orm import joinedload
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask import Flask
 from flask_apscheduler import APScheduler
-from website.fd_interface import create_match_model, create_team_model, get_all_areas_and_competitions, get_matches_by_competition, update_match_details, update_or_create_team
-from website.models import Area, Bet, BetMatch, Competition, Match, Team
-from website.random_generators import draw_lottery_numbers, generate_normalized_odds
+from website.cashout import update_cashout_offers
+from website.cursors import (COMPETITIONS_VERSION_CURSOR, ODDS_SNAPSHOT_CURSOR, get_cursor, get_cursor_time,
+                             increment_cursor, set_cursor, set_cursor_time)
+from website.fd_interface import fetch_football_data, get_all_areas_and_competitions, get_match_row, get_matches_by_competition, get_matches_by_ids, get_team_row
+from website.models import Area, Coach, Competition, Match, Player, Team, competition_team, match_team, team_player
+from website.liability import rebuild_liability
+from website.lottery_sim import get_prize_scale, print_report, simulate_lottery
+from website.odds_engine import reprice_competition
+from website.random_generators import draw_lottery_numbers, resolve_lottery_draw
+from website.scheduler_lock import LEASE_RENEW_SECONDS, acquire_leadership, run_exclusive
+from website.settlement import settle_bets
 from website.setup_db import db
+from website.standings import get_standings_lock, replace_scorers, replace_standings, update_standings
+from website.sync_engine import run_sync
+
+SYNC_DAYS_BACK = 2
+SYNC_DAYS_AHEAD = 7
+FULL_RECONCILE_INTERVAL = timedelta(hours=24)
+TEAM_PROFILE_MAX_AGE = timedelta(days=7)
+TEAM_PROFILES_PER_RUN = 30
+TERMINAL_MATCH_STATUSES = ('FINISHED', 'AWARDED', 'CANCELLED')
+TEAM_CARD_COLUMNS = ('name', 'short_name', 'tla', 'crest')
 
 def update_bet_status():
-    bets = Bet.query.options(joinedload(Bet.bet_matches).joinedload(BetMatch.match)).filter(Bet.status != 'PENDING').all()
-
-    for bet in bets:
-        all_matches_finished = all(bet_match.match.status == 'FINISHED' for bet_match in bet.bet_matches)
-        
-        if all_matches_finished:
-            user_won = True
-            for bet_match in bet.bet_matches:
-                match = bet_match.match
-                if bet_match.winner != match.winner:
-                    user_won = False
-                    break
-
-            bet.status = 'FINISHED'
-            bet.user_won = user_won
-            
-            db.session.commit()
+    settle_bets()
 
 def sync_areas_and_competitions():
     data = get_all_areas_and_competitions()
@@ -70,80 +74,303 @@ def sync_areas_and_competitions():
             )
             db.session.add(new_competition)  
 
+    increment_cursor(COMPETITIONS_VERSION_CURSOR)
     db.session.commit()
 
-def sync_matches_and_teams():
-    competitions = Competition.query.all()
+def get_sync_window(today: date) -> tuple[str, str]:
+    date_from = today - timedelta(days=SYNC_DAYS_BACK)
+    date_to = today + timedelta(days=SYNC_DAYS_AHEAD)
+    return date_from.isoformat(), date_to.isoformat()
 
-    for i, competition in enumerate(competitions):
-        data = get_matches_by_competition(competition.code)
+def fetch_competition_matches(code: str, full: bool, window: tuple[str, str], stale_ids: list[int]) -> list:
+    if full:
+        return get_matches_by_competition(code)
 
-        for match_data in data:
-            odds = generate_normalized_odds()
+    matches = get_matches_by_competition(code, *window)
+    if stale_ids:
+        matches.extend(get_matches_by_ids(stale_ids))
+    return matches
 
-            home_team_data = match_data['homeTeam']
-            away_team_data = match_data['awayTeam']
+def upsert_rows(model, rows: list[dict], update_columns: list[str], keep_first: tuple[str, ...] = (),
+                increment: tuple[str, ...] = (), conflict_columns: tuple[str, ...] = ('id',),
+                version_columns: tuple[str, ...] = ()) -> None:
+    """
+    version_columns bumps the row's version only when one of them actually changes.
+    """
+    if not rows:
+        return
+    stmt = sqlite_insert(model.__table__)
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    for column in keep_first:
+        set_[column] = func.coalesce(model.__table__.c[column], stmt.excluded[column])
+    for column in increment:
+        set_[column] = model.__table__.c[column] + 1
+    if version_columns:
+        changed = or_(*(model.__table__.c[column].is_distinct_from(stmt.excluded[column]) for column in version_columns))
+        set_['version'] = model.__table__.c.version + case((changed, 1), else_=0)
+    stmt = stmt.on_conflict_do_update(index_elements=[model.__table__.c[column] for column in conflict_columns], set_=set_)
+    db.session.execute(stmt, rows)
 
-            home_team = Team.query.get(home_team_data['id'])
-            if not home_team:
-                home_team = create_team_model(home_team_data)
-                db.session.add(home_team)
-            else:
-                update_or_create_team(home_team, home_team_data)
+def insert_missing_links(table, rows: set[tuple], columns: tuple[str, str]) -> None:
+    if not rows:
+        return
+    stmt = sqlite_insert(table).on_conflict_do_nothing()
+    db.session.execute(stmt, [dict(zip(columns, row)) for row in rows])
 
-            away_team = Team.query.get(away_team_data['id'])
-            if not away_team:
-                away_team = create_team_model(away_team_data)
-                db.session.add(away_team)
-            else:
-                update_or_create_team(away_team, away_team_data)
+def store_competition_matches(competition_id: int, data: list, full: bool = False) -> dict:
+    started = time.perf_counter()
+    competition = Competition.query.get(competition_id)
 
-            match = Match.query.get(match_data['id'])
-            if not match:
-                match = create_match_model(match_data)
-                db.session.add(match)
-            else:
-                update_match_details(match, match_data, competition.id, odds)
+    match_ids = [match_data['id'] for match_data in data]
+    existing_hashes = dict(db.session.query(Match.id, Match.payload_hash)
+                           .filter(Match.id.in_(match_ids))
+                           .all())
+    existing_competition_teams = {row.team_id for row in
+                                  db.session.query(competition_team.c.team_id)
+                                  .filter(competition_team.c.competition_id == competition_id)
+                                  .all()}
+
+    high_water_mark = get_cursor(f"matches:{competition_id}:hwm") or ""
+    # stored matches last updated before the previous sync's mark cannot have changed, so they are
+    # skipped without hashing; the full reconcile ignores the mark and re-checks every payload hash
+    previous_mark = "" if full else high_water_mark
+    now = datetime.now(timezone.utc)
+    team_rows = {}
+    match_rows = []
+    match_links = set()
+    skipped = 0
 
-            if home_team not in match.teams:
-                match.teams.append(home_team)
+    for match_data in data:
+        last_updated = match_data.get('lastUpdated') or ""
+        high_water_mark = max(high_water_mark, last_updated)
+        if last_updated and last_updated < previous_mark and match_data['id'] in existing_hashes:
+            skipped += 1
+            continue
+        match_row = get_match_row(match_data, competition_id)
+        if existing_hashes.get(match_row['id']) == match_row['payload_hash']:
+            continue
 
-            if away_team not in match.teams:
-                match.teams.append(away_team)
+        match_row['finished_at'] = now if match_row['status'] == 'FINISHED' else None
+        match_row['version'] = 1
+        match_rows.append(match_row)
 
-            if home_team not in competition.teams:
-                competition.teams.append(home_team)
+        for team_data in (match_data['homeTeam'], match_data['awayTeam']):
+            if team_data.get('id') is None:
+                continue
+            team_rows[team_data['id']] = get_team_row(team_data)
+            match_links.add((match_row['id'], team_data['id']))
+
+    existing_match_links = set()
+    if match_links:
+        existing_match_links = set(db.session.query(match_team.c.match_id, match_team.c.team_id)
+                                   .filter(match_team.c.match_id.in_([row['id'] for row in match_rows]))
+                                   .all())
+    competition_links = {(competition_id, team_id) for team_id in team_rows
+                         if team_id not in existing_competition_teams}
+
+    upsert_rows(Team, list(team_rows.values()), ['name', 'short_name', 'tla', 'crest'], version_columns=TEAM_CARD_COLUMNS)
+    upsert_rows(Match, match_rows,
+                [column for column in match_rows[0] if column not in ('id', 'finished_at', 'version')] if match_rows else [],
+                keep_first=('finished_at',), increment=('version',))
+    insert_missing_links(match_team, match_links - existing_match_links, ('match_id', 'team_id'))
+    insert_missing_links(competition_team, competition_links, ('competition_id', 'team_id'))
+
+    if high_water_mark:
+        set_cursor(f"matches:{competition_id}:hwm", high_water_mark)
+    if full:
+        set_cursor_time(f"matches:{competition_id}:full", now)
+    if match_rows:
+        increment_cursor(ODDS_SNAPSHOT_CURSOR)
+
+    db.session.commit()
+    reprice_competition(competition_id)
+    update_standings(competition_id)
 
-            if away_team not in competition.teams:
-                competition.teams.append(away_team)
+    stats = {
+        'competition': competition.code,
+        'changed': len(match_rows),
+        'unchanged': len(data) - len(match_rows),
+        'skipped': skipped,
+        'teams': len(team_rows),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    print(f"Competition {stats['competition']}: {stats['changed']} changed, {stats['unchanged']} unchanged "
+          f"({stats['skipped']} below the high-water mark), {stats['teams']} teams in {stats['seconds']}s")
+    return stats
 
+def needs_full_reconcile(competition_id: int, now: datetime) -> bool:
+    last_full_sync = get_cursor_time(f"matches:{competition_id}:full")
+    return last_full_sync is None or now - last_full_sync >= FULL_RECONCILE_INTERVAL
+
+def get_stale_unfinished_match_ids(competition_id: int, before: str) -> list[int]:
+    rows = (db.session.query(Match.id)
+            .filter(Match.competition_id == competition_id,
+                    Match.utc_date < before,
+                    Match.status.notin_(TERMINAL_MATCH_STATUSES))
+            .all())
+    return [row.id for row in rows]
+
+def sync_matches_and_teams(full: bool = False):
+    now = datetime.now(timezone.utc)
+    window = get_sync_window(now.date())
+
+    keys = []
+    for competition in Competition.query.all():
+        competition_full = full or needs_full_reconcile(competition.id, now)
+        stale_ids = [] if competition_full else get_stale_unfinished_match_ids(competition.id, window[0])
+        keys.append((competition.id, competition.code, competition_full, stale_ids))
+
+    run_sync(
+        keys,
+        fetch=lambda key: fetch_competition_matches(key[1], key[2], window, key[3]),
+        store=lambda key, data: store_competition_matches(key[0], data, full=key[2]),
+    )
+
+def fetch_competition_tables(code: str) -> tuple[list, list]:
+    standings = fetch_football_data(f"competitions/{code}/standings")
+    scorers = fetch_football_data(f"competitions/{code}/scorers")
+    return standings['standings'], scorers['scorers']
+
+def store_competition_tables(competition_id: int, data: tuple[list, list]) -> None:
+    standings, scorers = data
+    team_rows = {entry['team']['id']: get_team_row(entry['team'])
+                 for table in standings for entry in table['table']}
+    team_rows.update((scorer['team']['id'], get_team_row(scorer['team']))
+                     for scorer in scorers if scorer.get('team'))
+
+    upsert_rows(Team, list(team_rows.values()), ['name', 'short_name', 'tla', 'crest'], version_columns=TEAM_CARD_COLUMNS)
+    with get_standings_lock(competition_id):
+        replace_standings(competition_id, standings)
+        replace_scorers(competition_id, scorers)
         db.session.commit()
 
-        if i < len(competitions) - 1: 
-            time.sleep(10)
+def reconcile_standings_and_scorers():
+    run_sync(
+        [(competition.id, competition.code) for competition in Competition.query.all()],
+        fetch=lambda key: fetch_competition_tables(key[1]),
+        store=lambda key, data: store_competition_tables(key[0], data),
+    )
+
+def get_stale_team_ids(now: datetime, limit: int = TEAM_PROFILES_PER_RUN) -> list[int]:
+    rows = (db.session.query(Team.id)
+            .filter((Team.profile_updated_at.is_(None)) | (Team.profile_updated_at < now - TEAM_PROFILE_MAX_AGE))
+            .order_by(Team.profile_updated_at.isnot(None), Team.profile_updated_at)
+            .limit(limit)
+            .all())
+    return [row.id for row in rows]
+
+def store_team_profile(team_id: int, data: dict) -> None:
+    area_data = data.get('area') or {}
+    team_row = get_team_row(data)
+    team_row.update({
+        'area_id': area_data.get('id'),
+        'venue': data.get('venue'),
+        'founded': data.get('founded'),
+        'club_colors': data.get('clubColors'),
+        'website': data.get('website'),
+        'profile_updated_at': datetime.now(timezone.utc),
+    })
+    upsert_rows(Team, [team_row], [column for column in team_row if column != 'id'], version_columns=TEAM_CARD_COLUMNS)
+
+    coach_data = data.get('coach') or {}
+    contract = coach_data.get('contract') or {}
+    if coach_data.get('name'):
+        coach_row = {
+            'team_id': team_id,
+            'name': coach_data.get('name'),
+            'nationality': coach_data.get('nationality'),
+            'date_of_birth': coach_data.get('dateOfBirth'),
+            'contract_start': contract.get('start'),
+            'contract_until': contract.get('until'),
+        }
+        upsert_rows(Coach, [coach_row], [column for column in coach_row if column != 'team_id'],
+                    conflict_columns=('team_id',))
+    else:
+        Coach.query.filter_by(team_id=team_id).delete(synchronize_session=False)
+
+    player_rows = [{
+        'id': player['id'],
+        'name': player.get('name'),
+        'position': player.get('position'),
+        'nationality': player.get('nationality'),
+        'date_of_birth': player.get('dateOfBirth'),
+    } for player in data.get('squad') or []]
+    upsert_rows(Player, player_rows, ['name', 'position', 'nationality', 'date_of_birth'])
+    player_ids = [row['id'] for row in player_rows]
+    db.session.execute(team_player.delete().where(team_player.c.team_id == team_id,
+                                                  team_player.c.player_id.notin_(player_ids)))
+    insert_missing_links(team_player, {(team_id, player_id) for player_id in player_ids}, ('team_id', 'player_id'))
+
+    competition_ids = {row.id for row in db.session.query(Competition.id)
+                       .filter(Competition.id.in_([competition['id'] for competition in data.get('runningCompetitions') or []]))}
+    insert_missing_links(competition_team, {(competition_id, team_id) for competition_id in competition_ids},
+                         ('competition_id', 'team_id'))
+    db.session.commit()
+
+def refresh_team_profiles():
+    run_sync(
+        get_stale_team_ids(datetime.now(timezone.utc)),
+        fetch=lambda team_id: fetch_football_data(f"teams/{team_id}"),
+        store=store_team_profile,
+    )
+
+def run_lottery_draw():
+    report = simulate_lottery()
+    print_report(report)
+    draw = draw_lottery_numbers(get_prize_scale(report), report['expected_payout'])
+    winning_tickets = resolve_lottery_draw(draw)
+    db.session.commit()
+    print(f"Lottery draw {draw.numbers}: {len(winning_tickets)} winning tickets")
 
 def sync_areas_and_copmetitions_with_app_context(app: Flask):
     with app.app_context():
-        sync_areas_and_competitions()
+        run_exclusive('Job1', sync_areas_and_competitions)
 
 def sync_matches_and_teams_with_app_context(app: Flask):
     with app.app_context():
-        sync_matches_and_teams()
+        run_exclusive('Job2', sync_matches_and_teams)
+
+def reconcile_standings_and_scorers_with_app_context(app: Flask):
+    with app.app_context():
+        run_exclusive('Job5', reconcile_standings_and_scorers)
+
+def refresh_team_profiles_with_app_context(app: Flask):
+    with app.app_context():
+        run_exclusive('Job6', refresh_team_profiles)
+
+def rebuild_liability_with_app_context(app: Flask):
+    with app.app_context():
+        run_exclusive('Job7', rebuild_liability)
+
+def update_cashout_offers_with_app_context(app: Flask):
+    with app.app_context():
+        run_exclusive('Job8', update_cashout_offers)
 
 def draw_lottery_numbers_with_app_context(app: Flask):
     with app.app_context():
-        draw_lottery_numbers()
+        run_exclusive('Job4', run_lottery_draw)
 
 def update_bet_status_with_app_context(app: Flask):
     with app.app_context():
-        update_bet_status()
-    
+        run_exclusive('Job3', update_bet_status)
+
+def renew_leadership_with_app_context(app: Flask):
+    with app.app_context():
+        acquire_leadership()
+
 
-def init_scheduler(app: Flask):
+def init_scheduler(app: Flask) -> APScheduler:
     sched = APScheduler()
     sched.init_app(app)
-    sched.add_job(id='Job1', func=lambda: sync_areas_and_copmetitions_with_app_context(app), trigger='interval', seconds=800)
-    sched.add_job(id='Job2', func=lambda: sync_matches_and_teams_with_app_context(app), trigger='interval', seconds=800)
-    sched.add_job(id='Job3', func=lambda: update_bet_status_with_app_context(app), trigger='interval', seconds=10)
-    sched.add_job(id='Job4', func=lambda: draw_lottery_numbers_with_app_context(app), trigger='interval', min=10080) # once a week
+    job_options = {'trigger': 'interval', 'max_instances': 1, 'coalesce': True}
+    sched.add_job(id='Leader', func=lambda: renew_leadership_with_app_context(app), seconds=LEASE_RENEW_SECONDS, **job_options)
+    sched.add_job(id='Job1', func=lambda: sync_areas_and_copmetitions_with_app_context(app), seconds=800, **job_options)
+    sched.add_job(id='Job2', func=lambda: sync_matches_and_teams_with_app_context(app), seconds=800, **job_options)
+    sched.add_job(id='Job3', func=lambda: update_bet_status_with_app_context(app), seconds=10, **job_options)
+    sched.add_job(id='Job5', func=lambda: reconcile_standings_and_scorers_with_app_context(app), hours=1, **job_options)
+    sched.add_job(id='Job6', func=lambda: refresh_team_profiles_with_app_context(app), hours=1, **job_options)
+    sched.add_job(id='Job7', func=lambda: rebuild_liability_with_app_context(app), days=1, **job_options)
+    sched.add_job(id='Job8', func=lambda: update_cashout_offers_with_app_context(app), seconds=30, **job_options)
+    sched.add_job(id='Job4', func=lambda: draw_lottery_numbers_with_app_context(app), weeks=1, **job_options)
     sched.start()
+    return sched
@@ -0,0 +1,191 @@
+"""
+Local league tables and top scorers. Tables are advanced incrementally from newly finished
+matches and replaced wholesale when reconciled against the FD API
+"""
+from datetime import datetime, timezone
+from itertools import groupby
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from website.cursors import get_cursor_time, set_cursor_time
+from website.models import Match, ScorerSnapshot, Standing
+from website.scheduler_lock import get_job_lock
+from website.setup_db import db
+
+STANDING_STAGES = ('REGULAR_SEASON', 'LEAGUE_STAGE', 'GROUP_STAGE')
+FORM_LENGTH = 5
+POINTS = {'W': 3, 'D': 1, 'L': 0}
+
+
+def get_standings_cursor_name(competition_id: int) -> str:
+    return f"standings:{competition_id}"
+
+def get_result(goals_for: int, goals_against: int) -> str:
+    if goals_for > goals_against:
+        return 'W'
+    if goals_for < goals_against:
+        return 'L'
+    return 'D'
+
+def apply_result(standing: Standing, goals_for: int, goals_against: int, now: datetime) -> None:
+    result = get_result(goals_for, goals_against)
+    standing.played_games += 1
+    standing.won += result == 'W'
+    standing.draw += result == 'D'
+    standing.lost += result == 'L'
+    standing.goals_for += goals_for
+    standing.goals_against += goals_against
+    standing.points += POINTS[result]
+    previous = [letter for letter in (standing.form or "").split(",") if letter]
+    standing.form = ",".join([result] + previous[:FORM_LENGTH - 1])
+    standing.updated_at = now
+
+def assign_positions(table: list[Standing]) -> None:
+    table.sort(key=lambda row: (-row.points, -row.goal_difference, -row.goals_for, row.team_id))
+    for position, row in enumerate(table, start=1):
+        row.position = position
+
+def get_standings_lock(competition_id: int) -> threading.Lock:
+    """
+    Serializes the incremental update and the reconcile of a competition's tables,
+    which run in different scheduler threads and both move the standings cursor.
+    """
+    return get_job_lock(f"standings:{competition_id}")
+
+def update_standings(competition_id: int) -> int:
+    """
+    Applies the competition's matches that finished since the last update to its tables
+    and re-ranks only the tables they touched. Returns the number of matches applied.
+    """
+    with get_standings_lock(competition_id):
+        cursor_name = get_standings_cursor_name(competition_id)
+        last_finished_at = get_cursor_time(cursor_name)
+
+        query = (db.session.query(Match.stage, Match.group, Match.home_team_id, Match.away_team_id,
+                                  Match.full_time_home, Match.full_time_away, Match.finished_at)
+                 .filter(Match.competition_id == competition_id, Match.status == 'FINISHED',
+                         Match.stage.in_(STANDING_STAGES),
+                         Match.home_team_id.isnot(None), Match.away_team_id.isnot(None),
+                         Match.full_time_home.isnot(None), Match.full_time_away.isnot(None),
+                         Match.finished_at.isnot(None)))
+        if last_finished_at is not None:
+            query = query.filter(Match.finished_at > last_finished_at)
+        results = query.order_by(Match.kickoff_at, Match.id).all()
+        if not results:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        stages = {result.stage for result in results}
+        rows = {(row.stage, row.group, row.team_id): row
+                for row in Standing.query.filter(Standing.competition_id == competition_id,
+                                                 Standing.stage.in_(stages))}
+        touched = set()
+
+        for result in results:
+            group = result.group or ''
+            sides = ((result.home_team_id, result.full_time_home, result.full_time_away),
+                     (result.away_team_id, result.full_time_away, result.full_time_home))
+            for team_id, goals_for, goals_against in sides:
+                key = (result.stage, group, team_id)
+                standing = rows.get(key)
+                if standing is None:
+                    standing = rows[key] = Standing(competition_id=competition_id, stage=result.stage, group=group,
+                                                    team_id=team_id, played_games=0, won=0, draw=0, lost=0,
+                                                    goals_for=0, goals_against=0, points=0)
+                    db.session.add(standing)
+                apply_result(standing, goals_for, goals_against, now)
+            touched.add((result.stage, group))
+
+        for table_key in touched:
+            assign_positions([row for key, row in rows.items() if key[:2] == table_key])
+
+        set_cursor_time(cursor_name, max(result.finished_at for result in results))
+        db.session.commit()
+
+    print(f"Applied {len(results)} results to {len(touched)} tables for competition {competition_id}")
+    return len(results)
+
+
+def replace_standings(competition_id: int, standings_data: list) -> int:
+    """
+    Replaces the competition's tables with the API's total tables and moves the
+    incremental cursor past every match the API has already counted. Does not commit;
+    the caller holds get_standings_lock until it does.
+    """
+    now = datetime.now(timezone.utc)
+    rows = []
+    for table in standings_data:
+        if table.get('type', 'TOTAL') != 'TOTAL':
+            continue
+        for entry in table['table']:
+            rows.append({
+                'competition_id': competition_id,
+                'stage': table.get('stage') or 'REGULAR_SEASON',
+                'group': table.get('group') or '',
+                'team_id': entry['team']['id'],
+                'position': entry.get('position'),
+                'played_games': entry.get('playedGames') or 0,
+                'won': entry.get('won') or 0,
+                'draw': entry.get('draw') or 0,
+                'lost': entry.get('lost') or 0,
+                'goals_for': entry.get('goalsFor') or 0,
+                'goals_against': entry.get('goalsAgainst') or 0,
+                'points': entry.get('points') or 0,
+                'form': entry.get('form'),
+                'updated_at': now,
+            })
+
+    Standing.query.filter_by(competition_id=competition_id).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(Standing.__table__.insert(), rows)
+
+    last_finished_at = (db.session.query(func.max(Match.finished_at))
+                        .filter(Match.competition_id == competition_id, Match.status == 'FINISHED')
+                        .scalar())
+    if last_finished_at is not None:
+        set_cursor_time(get_standings_cursor_name(competition_id), last_finished_at)
+    return len(rows)
+
+def replace_scorers(competition_id: int, scorers_data: list) -> int:
+    """
+    Replaces the competition's top scorer snapshot. Does not commit.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [{
+        'competition_id': competition_id,
+        'player_id': scorer['player']['id'],
+        'player_name': scorer['player'].get('name'),
+        'nationality': scorer['player'].get('nationality'),
+        'section': scorer['player'].get('section'),
+        'shirt_number': scorer['player'].get('shirtNumber'),
+        'team_id': (scorer.get('team') or {}).get('id'),
+        'played_matches': scorer.get('playedMatches'),
+        'goals': scorer.get('goals'),
+        'assists': scorer.get('assists'),
+        'penalties': scorer.get('penalties'),
+        'updated_at': now,
+    } for scorer in scorers_data]
+
+    ScorerSnapshot.query.filter_by(competition_id=competition_id).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(ScorerSnapshot.__table__.insert(), rows)
+    return len(rows)
+
+
+def get_standings(competition_id: int) -> list[dict]:
+    rows = (Standing.query
+            .options(joinedload(Standing.team))
+            .filter(Standing.competition_id == competition_id)
+            .order_by(Standing.stage, Standing.group, Standing.position)
+            .all())
+    return [{'stage': stage, 'group': group or None, 'table': list(table)}
+            for (stage, group), table in groupby(rows, key=lambda row: (row.stage, row.group))]
+
+def get_scorers(competition_id: int) -> list[ScorerSnapshot]:
+    return (ScorerSnapshot.query
+            .options(joinedload(ScorerSnapshot.team))
+            .filter(ScorerSnapshot.competition_id == competition_id)
+            .order_by(ScorerSnapshot.goals.desc(), ScorerSnapshot.assists.desc())
+            .all())
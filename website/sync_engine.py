@@ -0,0 +1,65 @@
+"""
+Concurrent sync pipeline: competitions are fetched from the FD API concurrently
+(paced by the shared rate limiter) and handed to a single storage stage through a bounded queue
+"""
+import asyncio
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from website.fd_client import POOL_SIZE, get_client
+
+QUEUE_SIZE = 4
+
+
+def get_max_concurrent_fetches() -> int:
+    return max(1, min(POOL_SIZE, int(get_client().limiter.capacity)))
+
+
+async def _fetch(key: Any, fetch: Callable[[Any], Any], semaphore: asyncio.Semaphore, queue: asyncio.Queue) -> None:
+    async with semaphore:
+        try:
+            data = await asyncio.to_thread(fetch, key)
+        except Exception as e:
+            print(f"Sync fetch failed for {key}: {e}")
+            return
+    await queue.put((key, data))
+
+
+async def _store(queue: asyncio.Queue, store: Callable[[Any, Any], None], stats: dict) -> None:
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        key, data = item
+        try:
+            # storage runs on the loop thread so it shares the caller's app context and session
+            store(key, data)
+            stats["stored"] += 1
+        except Exception as e:
+            print(f"Sync store failed for {key}: {e}")
+            stats["failed"] += 1
+
+
+async def _run(keys: Iterable[Any], fetch: Callable[[Any], Any], store: Callable[[Any, Any], None],
+               max_concurrency: int) -> dict:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    stats = {"stored": 0, "failed": 0}
+
+    storer = asyncio.create_task(_store(queue, store, stats))
+    await asyncio.gather(*(_fetch(key, fetch, semaphore, queue) for key in keys))
+    await queue.put(None)
+    await storer
+
+    return stats
+
+
+def run_sync(keys: Iterable[Any], fetch: Callable[[Any], Any], store: Callable[[Any, Any], None],
+             max_concurrency: Optional[int] = None) -> dict:
+    keys = list(keys)
+    started = time.perf_counter()
+    stats = asyncio.run(_run(keys, fetch, store, max_concurrency or get_max_concurrent_fetches()))
+    stats["total"] = len(keys)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    print(f"Synced {stats['stored']}/{stats['total']} in {stats['seconds']}s")
+    return stats
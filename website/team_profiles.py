@@ -0,0 +1,52 @@
+"""
+Stored team profiles (area, coach, squad) and a keyset-paginated match timeline per team
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from website.models import Match, Team
+
+TIMELINE_PAGE_SIZE = 10
+
+
+def get_team_profile(team_id: int) -> Optional[Team]:
+    return (Team.query
+            .options(joinedload(Team.area), joinedload(Team.coach),
+                     selectinload(Team.players), selectinload(Team.competitions))
+            .filter(Team.id == team_id)
+            .first())
+
+def get_team_timeline(team_id: int, upcoming: bool, cursor_id: Optional[int] = None,
+                      page_size: int = TIMELINE_PAGE_SIZE) -> tuple[list[Match], Optional[int]]:
+    """
+    Returns the team's next (upcoming) or previous matches by kickoff time, continuing
+    after the match cursor_id, and the cursor for the following page (None on the last page).
+    """
+    now = datetime.utcnow()
+    query = (Match.query
+             .options(joinedload(Match.home_team), joinedload(Match.away_team))
+             .filter(or_(Match.home_team_id == team_id, Match.away_team_id == team_id)))
+
+    if upcoming:
+        query = query.filter(Match.kickoff_at >= now)
+        order = (Match.kickoff_at, Match.id)
+    else:
+        query = query.filter(Match.kickoff_at < now)
+        order = (Match.kickoff_at.desc(), Match.id.desc())
+
+    if cursor_id is not None:
+        cursor_kickoff = select(Match.kickoff_at).where(Match.id == cursor_id).scalar_subquery()
+        if upcoming:
+            query = query.filter(or_(Match.kickoff_at > cursor_kickoff,
+                                     and_(Match.kickoff_at == cursor_kickoff, Match.id > cursor_id)))
+        else:
+            query = query.filter(or_(Match.kickoff_at < cursor_kickoff,
+                                     and_(Match.kickoff_at == cursor_kickoff, Match.id < cursor_id)))
+
+    matches = query.order_by(*order).limit(page_size + 1).all()
+
+    next_cursor_id = matches[page_size - 1].id if len(matches) > page_size else None
+    return matches[:page_size], next_cursor_id
@@ -1,25 +1,30 @@
 """
 Handles routes for transaction
 """
-from flask import Blueprint, flash, redirect, render_template, request, url_for, current_app
+from flask import Blueprint, Response, flash, redirect, render_template, request, stream_with_context, url_for, current_app
 from flask_login import current_user, login_required
 from sqlalchemy.exc import SQLAlchemyError
 
+from website.balances import InsufficientFundsError, credit, debit, from_minor, parse_amount
+from website.ledger import stream_statement_csv, stream_statement_ndjson
 from website.setup_db import db
-from website.models import Transaction
 
 transactions = Blueprint('transactions', __name__, template_folder="../templates")
 
+MIN_DEPOSIT_MINOR = 1000
+STATEMENT_FORMATS = {
+    'csv': (stream_statement_csv, 'text/csv'),
+    'ndjson': (stream_statement_ndjson, 'application/x-ndjson'),
+}
+
 @transactions.route('/deposit', methods=['GET', 'POST'])
 @login_required
 def deposit():
     if request.method == 'POST':
-        amount = request.form.get('amount')
-
         try:
-            amount = float(amount)
+            amount_minor = parse_amount(request.form.get('amount'))
             
-            if amount < 10:
+            if amount_minor < MIN_DEPOSIT_MINOR:
                 flash("Minimum deposit is $10", category="error")
                 return redirect(url_for('transactions.deposit'))
 
@@ -28,11 +33,7 @@ def deposit():
             return redirect(url_for('transactions.deposit'))
 
         try:
-            transaction = Transaction(amount=amount, type='deposit', user_id=current_user.id)
-
-            current_user.balance += amount
-
-            db.session.add(transaction)
+            credit(current_user.id, amount_minor, 'deposit')
             db.session.commit()
 
             flash("Deposit successful!", category="success")
@@ -51,28 +52,24 @@ def deposit():
 def withdraw():
     if request.method == 'POST':
         try:
-            amount = float(request.form.get('amount'))
+            amount_minor = parse_amount(request.form.get('amount'))
 
-            if amount <= 0:
+            if amount_minor <= 0:
                 flash("Withdrawal amount must be greater than zero.", category="error")
                 return redirect(url_for('transactions.withdraw'))
 
-            elif current_user.balance < amount:
-                flash("Insufficient funds.", category="error")
-                return redirect(url_for('transactions.withdraw'))
-
-        except (ValueError, TypeError):
+        except ValueError:
             flash("Invalid amount entered.", category="error")
             return redirect(url_for('transactions.withdraw'))
 
         try:
-            current_user.balance -= amount
-            
-            transaction = Transaction(amount=amount, type='withdraw', user_id=current_user.id)
-            db.session.add(transaction)
+            debit(current_user.id, amount_minor, 'withdraw')
             db.session.commit()
 
-            flash(f"Successfully withdrew ${amount}!", category="success")
+            flash(f"Successfully withdrew ${from_minor(amount_minor):.2f}!", category="success")
+        except InsufficientFundsError:
+            db.session.rollback()
+            flash("Insufficient funds.", category="error")
         except SQLAlchemyError as e:
             db.session.rollback() 
             current_app.logger.error(f"Error processing withdrawal: {e}")
@@ -81,3 +78,15 @@ def withdraw():
         return redirect(url_for('transactions.withdraw'))
 
     return render_template('withdraw.html', user=current_user)
+
+
+@transactions.route('/statement')
+@login_required
+def statement():
+    statement_format = request.args.get('format', 'csv')
+    if statement_format not in STATEMENT_FORMATS:
+        return {'error': f"Unknown format, use one of {', '.join(STATEMENT_FORMATS)}"}, 400
+
+    stream, mimetype = STATEMENT_FORMATS[statement_format]
+    return Response(stream_with_context(stream(current_user.id)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=statement.{statement_format}'})
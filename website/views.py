@@ -1,43 +1,65 @@
 """
 Handles routes for showing information for matches, copetitions, matches, bets, teams using the FD API and lottery
 """
-from datetime import datetime
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
-from website.fd_interface import get_match_head2head_by_id, get_standings_by_competition, get_team_by_id, get_topscorers_by_competition
 
-from website.models import Area, Bet, BetMatch, Competition, LotteryNumbers, Match, Team, User, UserNumbers
+from website.bet_history import get_bet_history_page, get_bet_summary
+from website.bet_slip import bet_slips
+from website.cursors import COMPETITIONS_VERSION_CURSOR, get_cursor
+from website.fixtures import get_competitions_with_areas, get_fixtures_for_day, group_fixtures_by_competition, parse_day
+from website.fragment_cache import fragment_cache
+from website.head2head import get_head2head
+from website.models import Bet, BetMatch, Competition, LotteryNumbers, Match, Team, User, UserNumbers
+from website.random_generators import get_jackpot_winners
+from website.standings import get_scorers, get_standings
+from website.team_profiles import get_team_profile, get_team_timeline
 from .setup_db import db
 
 views = Blueprint('views', __name__, template_folder="../templates/")
 
 @views.route('/', methods=['GET', 'POST'])
 def home():
-    areas = Area.query.all()
-    date = request.args.get('date', datetime.utcnow().date().isoformat())
+    day = parse_day(request.args.get('date'))
+    fixtures = group_fixtures_by_competition(get_fixtures_for_day(day))
 
-    return render_template('home.html', user=current_user, areas=areas, date=date)
+    bet_slip = bet_slips.get(current_user.id) if current_user.is_authenticated else None
+
+    return render_template('home.html', user=current_user, competition_sidebar=render_competition_sidebar(),
+                           fixtures=fixtures, bet_slip=bet_slip, date=day.isoformat())
+
+
+def render_competition_sidebar():
+    key = ('_competition_sidebar.html', get_cursor(COMPETITIONS_VERSION_CURSOR))
+    return fragment_cache.get_or_render(
+        key, lambda: render_template('_competition_sidebar.html', competitions=get_competitions_with_areas()))
+
+@views.app_template_global()
+def match_fragment(template_name: str, match: Match, **context):
+    # the cards show team names and crests, which change without bumping the match version
+    teams = tuple((team.id, team.version) for team in match.teams)
+    key = (template_name, match.id, match.version, teams, tuple(sorted(context.items())))
+    return fragment_cache.get_or_render(key, lambda: render_template(template_name, match=match, **context))
 
 
 @views.route('/bets')
 @login_required
 def bets():
-    user_bets = Bet.query.filter_by(user_id=current_user.id).filter(Bet.status != 'PENDING').all()
-    
-    bet_matches = BetMatch.query.join(Match).filter(BetMatch.bet_id.in_([bet.id for bet in user_bets])).all()
+    before_id = request.args.get('before', type=int)
+    user_bets, next_before_id = get_bet_history_page(current_user.id, before_id)
+    summary = get_bet_summary(current_user.id)
 
-    return render_template('bets.html', user=current_user, bets=user_bets, bet_matches=bet_matches)
+    return render_template('bets.html', user=current_user, bets=user_bets, summary=summary, next_before_id=next_before_id)
 
 
 @views.route('/competitions/<int:id>', methods=['GET'])
 def competition_details(id):
     competition = Competition.query.get_or_404(id)
-    standings = get_standings_by_competition(competition.code)
-    scorers = get_topscorers_by_competition(competition.code)
-    
-    date = request.args.get('date', datetime.utcnow().date().isoformat())
+    standings = get_standings(competition.id)
+    scorers = get_scorers(competition.id)
     
-    filtered_matches = [match for match in competition.matches if match.utc_date.split('T')[0] == date]
+    day = parse_day(request.args.get('date'))
+    matches = get_fixtures_for_day(day, competition.id)
     
     return render_template(
         'competition.html',
@@ -45,8 +67,8 @@ def competition_details(id):
         competition=competition,
         standings=standings,
         scorers=scorers,
-        date=date,
-        matches=filtered_matches
+        date=day.isoformat(),
+        matches=matches
     )
     
 @views.route('/competitions/<int:competition_id>/matches/<int:match_id>', methods=['GET'])
@@ -55,8 +77,8 @@ def match_details(competition_id, match_id):
     
     match = Match.query.filter_by(id=match_id, competition_id=competition_id).first_or_404()
     
-    standings = get_standings_by_competition(competition.code)
-    data = get_match_head2head_by_id(match_id)
+    standings = get_standings(competition.id)
+    data = get_head2head(match)
     aggregates = data['aggregates']
     matches = data['matches']
     
@@ -64,26 +86,20 @@ def match_details(competition_id, match_id):
 
 @views.route('/teams/<int:id>')
 def team_details(id):
-    team_data = get_team_by_id(id)
-    area = team_data['area']
-    competitions = team_data['runningCompetitions']
-    coach = team_data['coach']
-    squad = team_data['squad']
-
-    team = Team.query.get(id)  
+    team = get_team_profile(id)
     if team is None:
         return "Team not found", 404
 
-    matches = team.matches  
+    upcoming, next_upcoming_id = get_team_timeline(id, upcoming=True, cursor_id=request.args.get('upcoming_after', type=int))
+    past, next_past_id = get_team_timeline(id, upcoming=False, cursor_id=request.args.get('past_before', type=int))
 
     return render_template('team.html',
-                           team_data=team_data,
                            user=current_user,
-                           area=area,
-                           competitions=competitions,
-                           coach=coach,
-                           squad=squad,
-                           matches=matches)
+                           team=team,
+                           upcoming=upcoming,
+                           next_upcoming_id=next_upcoming_id,
+                           past=past,
+                           next_past_id=next_past_id)
 
 
 @views.route('/lottery', methods=['GET', 'POST'])
@@ -91,10 +107,13 @@ def team_details(id):
 def lottery():
     if request.method == 'POST':
         numbers = [request.form.get(f'number{i}') for i in range(1, 6)]
-        numbers = list(map(int, numbers))
-        
-        user_id = current_user.id
-        user_numbers = UserNumbers(numbers=numbers, user_id=user_id)
+        try:
+            numbers = list(map(int, numbers))
+            user_numbers = UserNumbers(numbers=numbers, user_id=current_user.id)
+        except (TypeError, ValueError):
+            flash('Pick 5 different numbers from 1 to 35.', 'error')
+            return redirect(url_for('views.lottery'))
+
         db.session.add(user_numbers)
         db.session.commit()
         flash('Your numbers have been submitted!', 'success')
@@ -103,10 +122,7 @@ def lottery():
     latest_lottery = LotteryNumbers.query.order_by(LotteryNumbers.id.desc()).first()
     winners = []
     if latest_lottery:
-        latest_numbers = latest_lottery.get_numbers()
-        winners = User.query.join(UserNumbers).filter(
-            UserNumbers.numbers == ','.join(map(str, latest_numbers))
-        ).all()
+        winners = get_jackpot_winners(latest_lottery)
 
     previous_lotteries = LotteryNumbers.query.order_by(LotteryNumbers.id.desc()).all()
 
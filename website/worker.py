@@ -0,0 +1,28 @@
+"""
+Standalone scheduler process. Run with `python -m website.worker` and start
+the web workers with RUN_SCHEDULER=0 so only this process runs the jobs.
+"""
+import time
+
+from website.scheduler_lock import release_leadership
+from website.setup_app import create_app
+from website.setup_scheduler import init_scheduler
+
+
+def main() -> None:
+    app = create_app(start_scheduler=False)
+    sched = init_scheduler(app)
+    print("Scheduler worker started")
+
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        sched.shutdown()
+        with app.app_context():
+            release_leadership()
+        print("Scheduler worker stopped")
+
+
+if __name__ == '__main__':
+    main()